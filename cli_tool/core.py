@@ -1,28 +1,33 @@
 import sys
 import os
+import json
+import shutil
 import sqlite3
-from query_maker.query_maker import generate_query_no_args, generate_query_with_args
-from environ_detector.environ_detector import scan_project
+from query_maker.query_maker import write_query_no_args, primitive_repository, generation_key, primitives_digest, taxonomy_digest, stream_query_cached, parse_scope_flags, parse_selection_flags, write_query_suite, analyze_command, analysis_bqrs_path, SCAN_SUITE
+from environ_detector.environ_detector import scan_project, match_libraries
 from db_creator_updater.db_creator_updater import update
+from db_creator_updater.db_migrations import migrate
+from db_creator_updater.db_builder import build, parse_build_args, BUILD_USAGE
+from db_creator_updater.db_updates import apply_updates, BundleError, BUNDLE_DIR
 from report_maker.report_maker import make_pdf_report
+from db_validator.db_validator import check_coverage, print_report
 from utils.utils import log_message
 import subprocess
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DB', 'crypto_primitives.db')
 DB_PATH = os.path.normpath(DB_PATH)
 print(f"DB_PATH: {DB_PATH}")
-OUTPUT_DIR = 'generated_ql_queries'
+# The queries are generated into the query pack (codeql-pack.yml), where their suite resolves
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated_ql_queries')
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def get_all_libraries(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT library_id, name FROM Libraries ORDER BY library_id")
-    return cursor.fetchall()
+def get_all_libraries(repo):
+    return repo.libraries()
 
 def main():
     if len(sys.argv) < 2:
         print("Usage: python core.py <command> [options]")
-        print("Commands: scan-project, update-db, report")
+        print("Commands: scan-project, update-db, build-db, validate-db, report")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -32,45 +37,52 @@ def main():
         codeql_db_path = os.path.join(project_context_path, "codeql-db")
 
         if len(sys.argv) < 3:
-            print("Usage: python core.py scan-project <library_id_1|any> [<library_id_2> ...]")
-            conn = None
+            print("Usage: python core.py scan-project [--include=GLOB,...] [--exclude=GLOB,...] [--source-root] [--include-families=NAME,...] [--exclude-families=NAME,...] <library_id_1|any|auto> [<library_id_2> ...]")
             try:
-                conn = sqlite3.connect(DB_PATH)
-                all_libraries = get_all_libraries(conn)
+                all_libraries = get_all_libraries(primitive_repository(DB_PATH))
                 if all_libraries:
                     print("\n**Available Library IDs:**")
                     for lib_id, lib_name in all_libraries:
                         print(f"  ID: {lib_id}, Name: {lib_name}")
                 else:
                     print("\nNo libraries found in the database.")
-            except sqlite3.Error as e:
+            except (sqlite3.Error, OSError) as e:
                 print(f"Error accessing database: {e}")
-            finally:
-                if conn:
-                    conn.close()
             sys.exit(1)
         
-        input_library_ids_str = sys.argv[2:]
+        scope, input_library_ids_str = parse_scope_flags(sys.argv[2:])
+        selection, input_library_ids_str = parse_selection_flags(input_library_ids_str)
 
         library_ids = []
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
+            migrate(DB_PATH)
+            repo = primitive_repository(DB_PATH)
             
             if len(input_library_ids_str) == 1 and input_library_ids_str[0].lower() == 'any':
                 log_message("Input 'any' detected. Fetching all library IDs from the database.")
-                all_libraries = get_all_libraries(conn)
+                all_libraries = get_all_libraries(repo)
                 if not all_libraries:
                     log_message("No libraries found in the database to scan.")
                     sys.exit(1)
                 library_ids = [lib_id for lib_id, _ in all_libraries]
+            elif len(input_library_ids_str) == 1 and input_library_ids_str[0].lower() == 'auto':
+                log_message(f"Input 'auto' detected. Detecting the libraries linked by {project_context_path}.")
+                all_libraries = get_all_libraries(repo)
+                detected = scan_project(project_context_path)['libraries']
+                library_ids = match_libraries(detected, all_libraries)
+                if library_ids:
+                    names = [name for lib_id, name in all_libraries if lib_id in library_ids]
+                    log_message(f"Linked libraries found: {', '.join(names)}")
+                else:
+                    log_message(f"No known library among the detected ones ({', '.join(detected) or 'none'}). Scanning for all libraries.")
+                    library_ids = [lib_id for lib_id, _ in all_libraries]
             else:
                 for arg in input_library_ids_str:
                     try:
                         library_ids.append(int(arg))
                     except ValueError:
-                        log_message(f"Error: Invalid Library ID '{arg}'. Please enter integers or 'any'.")
-                        all_libraries = get_all_libraries(conn)
+                        log_message(f"Error: Invalid Library ID '{arg}'. Please enter integers, 'any' or 'auto'.")
+                        all_libraries = get_all_libraries(repo)
                         if all_libraries:
                             print("\n**Available Library IDs:**")
                             for lib_id, lib_name in all_libraries:
@@ -83,15 +95,13 @@ def main():
 
             log_message(f"Starting CodeQL scan for library IDs: {', '.join(map(str, library_ids))} (Project: {project_context_path}) using DB: {codeql_db_path}")
 
-            query_noargs = generate_query_no_args(conn, library_ids)
+            key = generation_key("query_noargs.ql", scope, selection, sorted(library_ids), primitives_digest(repo, library_ids), taxonomy_digest(selection) if selection is not None else None)
+            filename, reused = stream_query_cached(OUTPUT_DIR, "query_noargs.ql", key, lambda f: write_query_no_args(repo, library_ids, f, scope=scope, selection=selection))
 
-            if not query_noargs:
+            if not filename:
                 log_message("No QL file generated. Nothing to scan."); return
             
-            filename = os.path.join(OUTPUT_DIR, "query_noargs.ql")
-            with open(filename, 'w') as f:
-                    f.write(query_noargs)
-            log_message(f"Generated {filename}")
+            log_message(f"Up to date: {filename}" if reused else f"Generated {filename}")
 
             
             outputs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'outputs')
@@ -99,15 +109,13 @@ def main():
             
             bqrs_output_filename_suffix = '_'.join(map(str, library_ids)) if library_ids else 'all'
             bqrs_output_file = os.path.join(outputs_dir, f'problem_primitives-noargs-analysis.bqrs')
-            log_message(f"Running CodeQL queries, output to: {bqrs_output_file}")
-            
-            log_message(f"Running CodeQL query: {os.path.basename(filename)}")
-            cmd = [
-                "codeql", "query", "run", 
-                f"--database={codeql_db_path}", 
-                filename, 
-                f"--output={bqrs_output_file}", 
-            ]
+            sarif_output_file = os.path.splitext(bqrs_output_file)[0] + '.sarif'
+            log_message(f"Running CodeQL queries, output to: {sarif_output_file}")
+
+            # The generated queries run as one suite through a single `codeql database analyze`
+            suite_path = write_query_suite(OUTPUT_DIR, SCAN_SUITE, [os.path.basename(filename)])
+            log_message(f"Running CodeQL suite: {SCAN_SUITE} ({os.path.basename(filename)})")
+            cmd = analyze_command(codeql_db_path, suite_path, sarif_output_file)
 
             log_message(f"Executing: {' '.join(cmd)}")
 
@@ -116,29 +124,75 @@ def main():
                 
                 if result.stdout: log_message(f"CodeQL STDOUT:\n{result.stdout}")
                 if result.stderr: log_message(f"CodeQL STDERR:\n{result.stderr}")
-                log_message(f"Successfully ran query: {os.path.basename(filename)}")
+                log_message(f"Successfully ran suite: {SCAN_SUITE}, SARIF saved to: {sarif_output_file}")
             except subprocess.CalledProcessError as e:
-                log_message(f"Failed to run query: {os.path.basename(filename)}. Exit code: {e.returncode}")
+                log_message(f"Failed to run suite: {SCAN_SUITE}. Exit code: {e.returncode}")
                 log_message(f"CodeQL STDOUT:\n{e.stdout}")
                 log_message(f"CodeQL STDERR:\n{e.stderr}")
             except FileNotFoundError:
                 log_message("Error: 'codeql' command not found. Please ensure CodeQL CLI is in your PATH.")
             except Exception as e:
                 log_message(f"An unexpected error occurred during CodeQL query execution: {e}")
-
-        except sqlite3.Error as e:
+            else:
+                # The results of the query stay in the database; the report is made from the BQRS
+                bqrs_path = analysis_bqrs_path(codeql_db_path, os.path.basename(filename))
+                try:
+                    shutil.copyfile(bqrs_path, bqrs_output_file)
+                    log_message(f"Results saved to: {bqrs_output_file}")
+                except OSError as e:
+                    log_message(f"Could not copy the results of {os.path.basename(filename)} from {bqrs_path}: {e}")
+
+        except (sqlite3.Error, OSError) as e:
             log_message(f"Database error: {e}")
         except Exception as e:
             log_message(f"An unexpected error occurred in scan-project: {e}")
-        finally:
-            if conn:
-                conn.close()
         log_message("CodeQL scan finished.")
         
     elif command == 'update-db':
-        log_message("Creating or updating the database...")
-        update()
-        log_message("Database updated successfully.")
+        # python core.py update-db [<bundle dir or git mirror>]   apply the delta bundles (offline)
+        # python core.py update-db --git                          pull the repository instead
+        if len(sys.argv) > 2 and sys.argv[2] == '--git':
+            log_message("Creating or updating the database...")
+            update()
+            migrate(DB_PATH)
+            log_message("Database updated successfully.")
+            return
+        source = sys.argv[2] if len(sys.argv) > 2 else BUNDLE_DIR
+        log_message(f"Applying the delta bundles of {source}...")
+        try:
+            applied = apply_updates(source, DB_PATH)
+        except BundleError as e:
+            log_message(f"Error: {e}")
+            sys.exit(1)
+        log_message(f"Database updated to data version {applied[-1]}." if applied else "Database already up to date.")
+
+    elif command == 'build-db':
+        # python core.py build-db [--jobs=N] [--force] [library ...]
+        try:
+            jobs, force, libraries = parse_build_args(sys.argv[2:])
+        except ValueError as e:
+            print(f"Error: {e}")
+            print(f"Usage: python core.py build-db {BUILD_USAGE}")
+            sys.exit(1)
+        log_message("Extracting the primitives of the libraries whose sources changed...")
+        written = build(DB_PATH, libraries=libraries or None, jobs=jobs, force=force)
+        log_message(f"Database built: {', '.join(f'{lib} ({n} primitives)' for lib, n in written.items()) or 'nothing to update'}.")
+
+    elif command == 'validate-db':
+        # python core.py validate-db <docs_dir> [--output=report.json]
+        args = [a for a in sys.argv[2:] if not a.startswith("--output=")]
+        outputs = [a.split("=", 1)[1] for a in sys.argv[2:] if a.startswith("--output=")]
+        if len(args) != 1 or not os.path.isdir(args[0]):
+            print("Usage: python core.py validate-db <docs_dir> [--output=report.json]")
+            print("docs_dir holds one directory of documentation per library, named as in the DB.")
+            sys.exit(1)
+        log_message(f"Checking the DB primitives against the documentation in {args[0]}...")
+        report = check_coverage(args[0], primitive_repository(DB_PATH).primitive_names())
+        print_report(report)
+        if outputs:
+            with open(outputs[0], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            log_message(f"Full report written to {outputs[0]}")
 
     elif command == 'report':
        
@@ -158,7 +212,7 @@ def main():
         log_message("Report generated successfully.")
 
     else:
-        print("Unknown command. Available commands: scan-project, update-db, report")
+        print("Unknown command. Available commands: scan-project, update-db, build-db, validate-db, report")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from .db_migrations import migrate, search_rows, DB_PATH, SEARCH_TABLE, SEARCH_TRIGGERS
+except ImportError:
+    from db_migrations import migrate, search_rows, DB_PATH, SEARCH_TABLE, SEARCH_TRIGGERS
+try:
+    from query_maker import query_maker as taxonomy
+except ImportError:
+    # Run as a script from its directory: cli_tool is not on the path
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from query_maker import query_maker as taxonomy
+
+# Libraries to extract: {name: {"repo": url, "variants": {variant: build command}}}.
+# Each variant is a separate CodeQL DB of the same sources, built with its own command
+# (architecture, feature flags...); a null command lets CodeQL autobuild the sources.
+LIBRARIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libraries.json')
+WORK_DIR = os.path.normpath(os.path.join(os.path.dirname(DB_PATH), 'build'))
+QUERY_PACK_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'generated_ql_queries'))
+EXTRACT_QUERY = "extract_primitives.ql"
+
+# Functions declared in the headers of the library sources, with their parameters and the
+# index of their first string parameter (-1 if none), the candidate argument naming the algorithm
+EXTRACT_QUERY_TEXT = """/**
+ * @id cpp/primitives-extraction
+ * @name Library primitives
+ * @description Functions declared in the headers of the library
+ * @kind table
+ */
+
+import cpp
+
+predicate stringParameter(Function f, int i) {
+  exists(Type t | t = f.getParameter(i).getUnspecifiedType() |
+    t.(PointerType).getBaseType().getUnspecifiedType() instanceof CharType or
+    t.stripType().getName().matches("%string%")
+  )
+}
+
+from Function f, string parameters, int stringArg
+where
+  exists(FunctionDeclarationEntry e |
+    e = f.getADeclarationEntry() and
+    e.getFile().getExtension() = ["h", "hh", "hpp", "hxx"] and
+    exists(e.getFile().getRelativePath())
+  ) and
+  parameters = concat(int i | exists(f.getParameter(i)) | f.getParameter(i).getType().toString() + " " + f.getParameter(i).getName(), ", " order by i) and
+  (if stringParameter(f, _) then stringArg = min(int i | stringParameter(f, i)) else stringArg = -1)
+select f.getName(), f.getType().toString(), parameters, stringArg
+"""
+
+def load_libraries(path=LIBRARIES_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def remote_commit(repo_url):
+    """Commit of HEAD of the remote repository, None when it cannot be reached."""
+    result = subprocess.run(["git", "ls-remote", repo_url, "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0 or not result.stdout.split():
+        print(f"Error fetching remote commit of {repo_url}: {result.stderr.strip()}")
+        return None
+    return result.stdout.split()[0]
+
+# ======== Extraction (worker processes) ========
+
+def checkout(repo_url, commit, src_dir):
+    """Clean checkout of commit in src_dir, cloning the repository the first time."""
+    if not os.path.isdir(os.path.join(src_dir, ".git")):
+        shutil.rmtree(src_dir, ignore_errors=True)
+        subprocess.check_call(["git", "clone", "--quiet", repo_url, src_dir])
+    else:
+        subprocess.check_call(["git", "-C", src_dir, "fetch", "--quiet", "origin"])
+    subprocess.check_call(["git", "-C", src_dir, "checkout", "--quiet", "--force", commit])
+    subprocess.check_call(["git", "-C", src_dir, "clean", "--quiet", "-fdx"])
+
+def extract_variant(library, variant, repo_url, commit, command, work_dir=WORK_DIR):
+    """
+    Builds the CodeQL DB of one variant of a library at commit and runs EXTRACT_QUERY on it.
+    Runs in a worker process: every variant has its own checkout, so the builds do not interfere.
+    Returns (name, return type, parameters, string argument index) rows.
+    """
+    variant_dir = os.path.join(work_dir, library, variant)
+    src_dir = os.path.join(variant_dir, "src")
+    codeql_db = os.path.join(variant_dir, "codeql-db")
+    bqrs = os.path.join(variant_dir, "primitives.bqrs")
+    os.makedirs(variant_dir, exist_ok=True)
+    checkout(repo_url, commit, src_dir)
+
+    create = ["codeql", "database", "create", codeql_db, "--language=cpp", f"--source-root={src_dir}", "--overwrite"]
+    if command:
+        create.append(f"--command={command}")
+    subprocess.run(create, capture_output=True, text=True, check=True)
+    subprocess.run(["codeql", "query", "run", f"--database={codeql_db}", f"--output={bqrs}", os.path.join(QUERY_PACK_DIR, EXTRACT_QUERY)], capture_output=True, text=True, check=True)
+    decoded = subprocess.run(["codeql", "bqrs", "decode", "--format=json", "--result-set=#select", bqrs], capture_output=True, text=True, check=True)
+    return [tuple(row) for row in json.loads(decoded.stdout)["#select"]["tuples"]]
+
+# ======== Category matcher ========
+
+# Splits a function name on delimiters, camelCase/PascalCase and letter/digit boundaries:
+# CryptoClass::super_AES256 -> crypto, class, super, aes, 256
+NAME_TOKEN_RE = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+MAX_JOINED_TOKENS = 4  # blake2b -> blake, 2, b
+
+def normalize_token(token):
+    return re.sub(r'[^a-z0-9]', '', token.lower())
+
+def load_matcher():
+    """
+    ({algorithm token: (category, alternative)}, operation tokens, {category: general alternative})
+    of the compiled taxonomy the query generator uses (see query_maker.load_taxonomy), reloaded
+    if cats_alts.json changed: the families and their resolved alternatives are the same for both.
+    """
+    taxonomy.reload_taxonomy_if_changed()
+    algorithms = {}
+    for category, _family, tokens, alternative in taxonomy.flatten_algos_families():
+        for token in tokens:
+            algorithms.setdefault(normalize_token(token), (category, alternative))
+    operations = {normalize_token(t) for t in taxonomy.ALL_OPS_FLAT}
+    return algorithms, operations, dict(taxonomy.ALTS_CATS)
+
+def classify(name, matcher):
+    """
+    (categories, alternative) of a function name: the categories of the algorithms found in it,
+    taking the longest match at each position (aes256 rather than aes), and the alternative of
+    the first one. None when no algorithm is named but an operation is, so the arguments
+    decide; () when the name is not a crypto primitive.
+    """
+    algorithms, operations, _ = matcher
+    tokens = [t.lower() for t in NAME_TOKEN_RE.findall(name)]
+    categories, alternative, has_operation = [], None, False
+    i = 0
+    while i < len(tokens):
+        for j in range(min(len(tokens), i + MAX_JOINED_TOKENS), i, -1):
+            joined = "".join(tokens[i:j])
+            if joined in algorithms:
+                category, alt = algorithms[joined]
+                if category not in categories:
+                    categories.append(category)
+                alternative = alternative or alt
+                i = j
+                break
+            has_operation = has_operation or joined in operations
+        else:
+            i += 1
+    if categories:
+        return categories, alternative
+    return None if has_operation else ()
+
+# ======== DB builder ========
+
+def category_id(conn, name, general_alternative):
+    row = conn.execute("SELECT category_id FROM Categories WHERE name = ?", (name,)).fetchone()
+    if row:
+        return row[0]
+    return conn.execute("INSERT INTO Categories(name, comment_alternative_general) VALUES (?, ?)", (name, general_alternative)).lastrowid
+
+def write_library(conn, library, commit, rows, matcher):
+    """
+    Replaces the primitives of library by the classified rows in a single transaction, with
+    bulk inserts, and records commit as its source commit. Returns the number of primitives.
+    The primitive_search triggers are dropped inside the transaction and the search rows of
+    the library rebuilt at once, instead of twice per inserted row.
+    """
+    primitives, links = [], []
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for name in SEARCH_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        row = conn.execute("SELECT library_id FROM Libraries WHERE name = ?", (library,)).fetchone()
+        library_id = row[0] if row else conn.execute("INSERT INTO Libraries(name) VALUES (?)", (library,)).lastrowid
+        conn.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT primitive_id FROM Primitives WHERE library_id = ?)", (library_id,))
+        conn.execute("DELETE FROM Primitive_categories WHERE primitive_id IN (SELECT primitive_id FROM Primitives WHERE library_id = ?)", (library_id,))
+        conn.execute("DELETE FROM Primitives WHERE library_id = ?", (library_id,))
+        next_id = conn.execute("SELECT COALESCE(MAX(primitive_id), 0) + 1 FROM Primitives").fetchone()[0]
+        categories = {}
+        seen = set()
+        for name, return_type, parameters, string_arg in rows:
+            # The variants of a library declare mostly the same functions
+            if (name, parameters) in seen:
+                continue
+            seen.add((name, parameters))
+            classification = classify(name, matcher)
+            if classification is None:
+                if string_arg < 0:
+                    continue
+                primitives.append((next_id, name, library_id, string_arg, None, parameters, return_type))
+            elif classification:
+                names, alternative = classification
+                primitives.append((next_id, name, library_id, None, alternative, parameters, return_type))
+                for category in names:
+                    if category not in categories:
+                        categories[category] = category_id(conn, category, matcher[2].get(category))
+                    links.append((next_id, categories[category]))
+            else:
+                continue
+            next_id += 1
+        conn.executemany("INSERT INTO Primitives(primitive_id, name, library_id, need_arg, comment_alternative, parameters, return_type) VALUES (?, ?, ?, ?, ?, ?, ?)", primitives)
+        conn.executemany("INSERT INTO Primitive_categories(primitive_id, category_id) VALUES (?, ?)", links)
+        conn.execute("UPDATE Libraries SET source_commit = ? WHERE library_id = ?", (commit, library_id))
+        conn.execute(f"INSERT INTO {SEARCH_TABLE}(rowid, name, library, categories, alternative) {search_rows('p.library_id = ?')}", (library_id,))
+        for statement in SEARCH_TRIGGERS.values():
+            conn.execute(statement)
+    return len(primitives)
+
+def build(db_path=DB_PATH, libraries=None, jobs=None, force=False, work_dir=WORK_DIR):
+    """
+    Extracts the primitives of the libraries of LIBRARIES_FILE (all, or the given names) into
+    the DB at db_path. Only the libraries whose remote commit differs from their recorded
+    source commit are extracted, unless force is set. Every variant of every library runs in
+    its own worker of a process pool of jobs processes; a library is written as soon as all
+    its variants are extracted, and left untouched if one of them failed.
+    Returns {library: number of primitives written}.
+    """
+    config = load_libraries()
+    unknown = set(libraries or ()) - set(config)
+    if unknown:
+        print(f"Unknown libraries: {', '.join(sorted(unknown))} (see {LIBRARIES_FILE})")
+    if migrate(db_path) is None:
+        return {}
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    try:
+        recorded = dict(conn.execute("SELECT name, source_commit FROM Libraries").fetchall())
+        todo = {}
+        for library, entry in config.items():
+            if libraries and library not in libraries:
+                continue
+            commit = remote_commit(entry["repo"])
+            if commit is None:
+                continue
+            if not force and recorded.get(library) == commit:
+                print(f"{library} is up to date ({commit[:12]})")
+                continue
+            todo[library] = (entry, commit)
+        if not todo:
+            return {}
+
+        with open(os.path.join(QUERY_PACK_DIR, EXTRACT_QUERY), "w", encoding="utf-8") as f:
+            f.write(EXTRACT_QUERY_TEXT)
+        matcher = load_matcher()
+        written = {}
+        pending = {library: len(entry["variants"]) for library, (entry, _) in todo.items()}
+        rows = {library: [] for library in todo}
+        failed = set()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(extract_variant, library, variant, entry["repo"], commit, command, work_dir): (library, variant)
+                for library, (entry, commit) in todo.items()
+                for variant, command in entry["variants"].items()
+            }
+            for future in as_completed(futures):
+                library, variant = futures[future]
+                try:
+                    rows[library].extend(future.result())
+                    print(f"Extracted {library} ({variant})")
+                except subprocess.CalledProcessError as e:
+                    failed.add(library)
+                    print(f"Error extracting {library} ({variant}): {' '.join(e.cmd)} exited with {e.returncode}\n{e.stderr or ''}")
+                except Exception as e:
+                    failed.add(library)
+                    print(f"Error extracting {library} ({variant}): {e}")
+                pending[library] -= 1
+                if pending[library] == 0 and library not in failed:
+                    written[library] = write_library(conn, library, todo[library][1], rows.pop(library), matcher)
+                    print(f"Wrote {written[library]} primitives of {library}")
+        if failed:
+            print(f"Not updated: {', '.join(sorted(failed))}")
+        return written
+    finally:
+        conn.close()
+
+BUILD_USAGE = "[--jobs=N] [--force] [library ...]"
+
+def parse_build_args(args):
+    """(jobs, force, libraries) of the build arguments; ValueError when --jobs is not a positive integer."""
+    jobs, force, libraries = None, False, []
+    for arg in args:
+        if arg.startswith("--jobs="):
+            value = arg.split("=", 1)[1]
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError(f"--jobs must be a positive integer, not '{value}'")
+            jobs = int(value)
+        elif arg == "--force":
+            force = True
+        else:
+            libraries.append(arg)
+    return jobs, force, libraries
+
+def main():
+    try:
+        jobs, force, libraries = parse_build_args(sys.argv[1:])
+    except ValueError as e:
+        print(f"Error: {e}")
+        print(f"Usage: python db_builder.py {BUILD_USAGE}")
+        sys.exit(1)
+    build(libraries=libraries or None, jobs=jobs, force=force)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import sys
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DB', 'crypto_primitives.db')
+DB_PATH = os.path.normpath(DB_PATH)
+
+# Full-text index of the primitives: one row per primitive (rowid = primitive_id) with its
+# name, library, categories and alternatives. The trigram tokenizer makes every substring of
+# 3+ characters (and so every prefix) an index lookup, whatever the case or camelCase.
+SEARCH_TABLE = "primitive_search"
+
+def search_rows(where):
+    """SELECT of the primitive_search rows of the Primitives p matching where."""
+    return f"""
+        SELECT p.primitive_id, p.name,
+               (SELECT l.name FROM Libraries l WHERE l.library_id = p.library_id),
+               (SELECT group_concat(c.name, ', ') FROM Primitive_categories pc JOIN Categories c ON c.category_id = pc.category_id WHERE pc.primitive_id = p.primitive_id),
+               COALESCE(p.comment_alternative, (SELECT group_concat(DISTINCT c.comment_alternative_general) FROM Primitive_categories pc JOIN Categories c ON c.category_id = pc.category_id WHERE pc.primitive_id = p.primitive_id))
+        FROM Primitives p
+        WHERE {where}"""
+
+def refresh_search(where):
+    """Trigger statements rebuilding the primitive_search rows of the Primitives p matching where."""
+    return f"""
+        DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT p.primitive_id FROM Primitives p WHERE {where});
+        INSERT INTO {SEARCH_TABLE}(rowid, name, library, categories, alternative) {search_rows(where)};"""
+
+def search_trigger(name, event, table, body):
+    """(name, CREATE TRIGGER statement) of a trigger running body after event on table."""
+    return name, f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN {body}\n    END"
+
+# Triggers keeping primitive_search in sync with the four tables it denormalizes. Bulk
+# writers (see db_builder) drop them for the time of their transaction and rebuild the rows.
+SEARCH_TRIGGERS = dict([
+    search_trigger("primitive_search_ai", "INSERT", "Primitives", refresh_search("p.primitive_id = new.primitive_id")),
+    search_trigger("primitive_search_au", "UPDATE", "Primitives", f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.primitive_id;" + refresh_search("p.primitive_id = new.primitive_id")),
+    search_trigger("primitive_search_ad", "DELETE", "Primitives", f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.primitive_id;"),
+    search_trigger("primitive_search_pc_ai", "INSERT", "Primitive_categories", refresh_search("p.primitive_id = new.primitive_id")),
+    search_trigger("primitive_search_pc_au", "UPDATE", "Primitive_categories", refresh_search("p.primitive_id IN (old.primitive_id, new.primitive_id)")),
+    search_trigger("primitive_search_pc_ad", "DELETE", "Primitive_categories", refresh_search("p.primitive_id = old.primitive_id")),
+    search_trigger("primitive_search_c_ai", "INSERT", "Categories", refresh_search("p.primitive_id IN (SELECT primitive_id FROM Primitive_categories WHERE category_id = new.category_id)")),
+    search_trigger("primitive_search_c_au", "UPDATE", "Categories", refresh_search("p.primitive_id IN (SELECT primitive_id FROM Primitive_categories WHERE category_id IN (old.category_id, new.category_id))")),
+    search_trigger("primitive_search_c_ad", "DELETE", "Categories", refresh_search("p.primitive_id IN (SELECT primitive_id FROM Primitive_categories WHERE category_id = old.category_id)")),
+    search_trigger("primitive_search_l_ai", "INSERT", "Libraries", refresh_search("p.library_id = new.library_id")),
+    search_trigger("primitive_search_l_au", "UPDATE", "Libraries", refresh_search("p.library_id IN (old.library_id, new.library_id)")),
+    search_trigger("primitive_search_l_ad", "DELETE", "Libraries", refresh_search("p.library_id = old.library_id")),
+])
+
+# Schema migrations of crypto_primitives.db, in order. The version of a DB file is kept in
+# PRAGMA user_version: a file at version N only gets the migrations after N, so older files
+# are upgraded in place. Never edit a released migration, append a new one.
+MIGRATIONS = [
+    # 1: covering indexes for the query generators. The no-args/with-args queries filter
+    # Primitives on library_id and need_arg, sort on name and read comment_alternative, then
+    # join Primitive_categories
+    (1, [
+        "CREATE INDEX IF NOT EXISTS idx_primitives_library_need_arg ON Primitives(library_id, need_arg, name, primitive_id, comment_alternative)",
+        "CREATE INDEX IF NOT EXISTS idx_primitive_categories_primitive ON Primitive_categories(primitive_id, category_id)",
+    ]),
+    # 2: primitive_search, filled from the current rows and kept in sync by SEARCH_TRIGGERS
+    (2, [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(name, library, categories, alternative, tokenize = 'trigram')",
+        "CREATE INDEX IF NOT EXISTS idx_primitive_categories_category ON Primitive_categories(category_id)",
+        f"INSERT INTO {SEARCH_TABLE}(rowid, name, library, categories, alternative) {search_rows('1')}",
+    ] + list(SEARCH_TRIGGERS.values())),
+    # 3: commit of the library sources the primitives were extracted from (see db_builder)
+    (3, [
+        "ALTER TABLE Libraries ADD COLUMN source_commit TEXT",
+    ]),
+    # 4: key/value metadata of the DB contents, e.g. the data version of the delta bundles
+    # applied to it (see db_updates)
+    (4, [
+        "CREATE TABLE IF NOT EXISTS Metadata(key TEXT PRIMARY KEY, value TEXT)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db_path=DB_PATH):
+    """
+    Brings the DB file at db_path to SCHEMA_VERSION and turns on WAL.
+    Each pending migration runs in its own transaction together with its user_version bump,
+    then ANALYZE refreshes the planner statistics. Nothing is written when the file is up to date.
+    Returns the schema version of the file.
+    """
+    if not os.path.isfile(db_path):
+        print(f"Error: database not found at {db_path}")
+        return None
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            conn.execute("PRAGMA journal_mode=WAL")
+        version = schema_version(conn)
+        applied = False
+        for target, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"Applied migration {target} to {db_path}")
+            version = target
+            applied = True
+        if applied or not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+            conn.execute("ANALYZE")
+        return version
+    finally:
+        conn.close()
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    version = migrate(db_path)
+    if version is None:
+        sys.exit(1)
+    print(f"{db_path} is at schema version {version}")
+
+if __name__ == "__main__":
+    main()
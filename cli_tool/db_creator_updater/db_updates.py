@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+try:
+    from .db_migrations import migrate, DB_PATH
+except ImportError:
+    from db_migrations import migrate, DB_PATH
+
+# Offline updates of crypto_primitives.db and cats_alts.json through delta bundles.
+# A bundle source is a local directory, or a local git mirror of one, holding MANIFEST:
+#   {"bundles": [{"file": "...", "from": 3, "to": 4, "sha256": "..."}, ...]}
+# and the bundle files it lists. A bundle brings the data from version "from" to "to":
+#   {"format": 1, "from": 3, "to": 4,
+#    "tables": {table: {"delete": [key, ...], "upsert": [{column: value}, ...]}},
+#    "cats_alts": {"base_sha256": "...", "ops": [{"op": "set"|"remove", "path": [...], "value": ...}]}}
+# The key of a row is its primary key, or both of its ids for Primitive_categories.
+# base_sha256 is the hash of the canonical JSON of cats_alts.json (see taxonomy_sha256), so it
+# does not depend on how the file was formatted by the previous bundle or by hand.
+BUNDLE_DIR = os.path.normpath(os.path.join(os.path.dirname(DB_PATH), 'updates'))
+MANIFEST = "manifest.json"
+BUNDLE_FORMAT = 2
+json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils", "cats_alts.json")
+
+# Tables a bundle can change, in the order their upserts are applied (deletes run in reverse)
+TABLE_KEYS = [
+    ("Libraries", ("library_id",)),
+    ("Categories", ("category_id",)),
+    ("Primitives", ("primitive_id",)),
+    ("Primitive_categories", ("primitive_id", "category_id")),
+]
+
+class BundleError(Exception):
+    pass
+
+def taxonomy_sha256(taxonomy):
+    """SHA-256 of the canonical JSON of the cats_alts.json data: sorted keys, no whitespace."""
+    canonical = json.dumps(taxonomy, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def data_version(conn):
+    row = conn.execute("SELECT value FROM Metadata WHERE key = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+# ======== Bundle sources ========
+
+def is_git_mirror(source):
+    """True when source is the top level of a git work tree without a checked out MANIFEST."""
+    if os.path.isfile(os.path.join(source, MANIFEST)):
+        return False
+    result = subprocess.run(["git", "-C", source, "rev-parse", "--show-toplevel"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.returncode == 0 and os.path.normcase(os.path.realpath(result.stdout.strip())) == os.path.normcase(os.path.realpath(source))
+
+def read_source_file(source, name):
+    """Bytes of name in the bundle source: a file of the directory, or of HEAD of the git mirror."""
+    if is_git_mirror(source):
+        result = subprocess.run(["git", "-C", source, "show", f"HEAD:{name}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise BundleError(f"{name} not found in {source}: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+    try:
+        with open(os.path.join(source, name), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise BundleError(f"{name} not found in {source}")
+
+def pending_bundles(manifest, version):
+    """Entries of the manifest chaining from version to the latest version, in order."""
+    by_from = {entry["from"]: entry for entry in manifest.get("bundles", [])}
+    chain = []
+    while version in by_from:
+        entry = by_from[version]
+        chain.append(entry)
+        version = entry["to"]
+    return chain
+
+def load_bundle(source, entry):
+    data = read_source_file(source, entry["file"])
+    digest = hashlib.sha256(data).hexdigest()
+    if digest != entry["sha256"]:
+        raise BundleError(f"{entry['file']}: SHA-256 {digest} does not match the manifest ({entry['sha256']})")
+    bundle = json.loads(data)
+    if bundle.get("format") != BUNDLE_FORMAT or bundle.get("from") != entry["from"] or bundle.get("to") != entry["to"]:
+        raise BundleError(f"{entry['file']}: unsupported format or versions not matching the manifest")
+    return bundle
+
+# ======== Applying ========
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def apply_rows(conn, bundle):
+    """Applies the row deletes and upserts of bundle; the caller owns the transaction."""
+    tables = bundle.get("tables", {})
+    for table, key in reversed(TABLE_KEYS):
+        for row_key in tables.get(table, {}).get("delete", []):
+            row_key = row_key if isinstance(row_key, list) else [row_key]
+            conn.execute(f"DELETE FROM {table} WHERE " + " AND ".join(f"{k} = ?" for k in key), row_key)
+    for table, key in TABLE_KEYS:
+        columns = table_columns(conn, table)
+        for row in tables.get(table, {}).get("upsert", []):
+            unknown = set(row) - columns
+            if unknown or not set(key) <= set(row):
+                raise BundleError(f"{table}: bad row {row}")
+            names = list(row)
+            values = [row[c] for c in names]
+            placeholders = ', '.join('?' * len(names))
+            if table == "Primitive_categories":
+                # No key constraint: the link is inserted unless it already exists
+                match = " AND ".join(f"{k} = ?" for k in key)
+                conn.execute(f"INSERT INTO {table}({', '.join(names)}) SELECT {placeholders} WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match})", values + [row[k] for k in key])
+                continue
+            updates = ", ".join(f"{c} = excluded.{c}" for c in names if c not in key)
+            conflict = f"ON CONFLICT({', '.join(key)}) " + (f"DO UPDATE SET {updates}" if updates else "DO NOTHING")
+            conn.execute(f"INSERT INTO {table}({', '.join(names)}) VALUES ({placeholders}) {conflict}", values)
+
+def patch_taxonomy(taxonomy, ops):
+    """Applies the set/remove ops of a bundle to the cats_alts.json data, in place."""
+    for op in ops:
+        *parents, last = op["path"]
+        node = taxonomy
+        for name in parents:
+            node = node.setdefault(name, {})
+        if op["op"] == "set":
+            node[last] = op["value"]
+        elif op["op"] == "remove":
+            node.pop(last, None)
+        else:
+            raise BundleError(f"Unknown cats_alts.json operation {op['op']}")
+
+def apply_updates(source=BUNDLE_DIR, db_path=DB_PATH, taxonomy_path=json_path):
+    """
+    Applies the bundles of source newer than the data version of the DB, in order. Every bundle
+    is checked against the SHA-256 of the manifest and applied in one transaction with the data
+    version bump, so only the rows it lists are written; cats_alts.json is patched in the same
+    step when the hash of its current content is the base of the patch. Returns the versions applied.
+    The generation cache keys on the rows and taxonomy families each query reads, so the next
+    generation only rebuilds the queries of the libraries and families that changed.
+    """
+    if migrate(db_path) is None:
+        return []
+    manifest = json.loads(read_source_file(source, MANIFEST))
+    conn = sqlite3.connect(db_path)
+    applied = []
+    try:
+        for entry in pending_bundles(manifest, data_version(conn)):
+            bundle = load_bundle(source, entry)
+            taxonomy_patch = bundle.get("cats_alts")
+            if taxonomy_patch:
+                with open(taxonomy_path, "rb") as f:
+                    current = f.read()
+                taxonomy = json.loads(current)
+                if taxonomy_sha256(taxonomy) != taxonomy_patch["base_sha256"]:
+                    raise BundleError(f"{entry['file']}: cats_alts.json differs from the base of the patch")
+                patch_taxonomy(taxonomy, taxonomy_patch["ops"])
+                # Written before the transaction and renamed as its last step, so the DB and
+                # cats_alts.json move to the new version together
+                with open(taxonomy_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(taxonomy, f, indent=4)
+                    f.write("\n")
+            replaced = False
+            try:
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    apply_rows(conn, bundle)
+                    conn.execute("INSERT INTO Metadata(key, value) VALUES ('data_version', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (str(entry["to"]),))
+                    if taxonomy_patch:
+                        os.replace(taxonomy_path + ".tmp", taxonomy_path)
+                        replaced = True
+            except BaseException:
+                if replaced:
+                    # The commit failed after the rename: back to the taxonomy of the DB version
+                    with open(taxonomy_path, "wb") as f:
+                        f.write(current)
+                elif taxonomy_patch and os.path.exists(taxonomy_path + ".tmp"):
+                    os.remove(taxonomy_path + ".tmp")
+                raise
+            print(f"Applied {entry['file']} (data version {entry['from']} -> {entry['to']})")
+            applied.append(entry["to"])
+    finally:
+        conn.close()
+    return applied
+
+# ======== Making bundles ========
+
+def table_rows(conn, table, key):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    rows = {}
+    for values in conn.execute(f"SELECT {', '.join(columns)} FROM {table}"):
+        row = dict(zip(columns, values))
+        rows[tuple(row[k] for k in key)] = row
+    return rows
+
+def diff_taxonomy(old, new, path=()):
+    """set/remove ops turning the cats_alts.json data old into new."""
+    ops = []
+    for name in old.keys() - new.keys():
+        ops.append({"op": "remove", "path": list(path) + [name]})
+    for name, value in new.items():
+        if isinstance(value, dict) and isinstance(old.get(name), dict):
+            ops.extend(diff_taxonomy(old[name], value, path + (name,)))
+        elif old.get(name, None) != value or name not in old:
+            ops.append({"op": "set", "path": list(path) + [name], "value": value})
+    return ops
+
+def make_bundle(old_db, new_db, out_dir, old_taxonomy=None, new_taxonomy=None):
+    """
+    Writes the bundle turning old_db (and old_taxonomy) into new_db (and new_taxonomy) to
+    out_dir and appends it to its manifest, one data version after the latest one.
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {"bundles": []}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    version = max([e["to"] for e in manifest["bundles"]], default=0)
+    bundle = {"format": BUNDLE_FORMAT, "from": version, "to": version + 1, "tables": {}}
+    old_conn, new_conn = sqlite3.connect(old_db), sqlite3.connect(new_db)
+    try:
+        for table, key in TABLE_KEYS:
+            old_rows, new_rows = table_rows(old_conn, table, key), table_rows(new_conn, table, key)
+            delete = [list(k) if len(k) > 1 else k[0] for k in old_rows.keys() - new_rows.keys()]
+            upsert = [row for k, row in new_rows.items() if old_rows.get(k) != row]
+            if delete or upsert:
+                bundle["tables"][table] = {"delete": sorted(delete, key=repr), "upsert": sorted(upsert, key=repr)}
+    finally:
+        old_conn.close()
+        new_conn.close()
+    if old_taxonomy and new_taxonomy:
+        with open(old_taxonomy, "r", encoding="utf-8") as f:
+            old_data = json.load(f)
+        with open(new_taxonomy, "r", encoding="utf-8") as f:
+            ops = diff_taxonomy(old_data, json.load(f))
+        if ops:
+            bundle["cats_alts"] = {"base_sha256": taxonomy_sha256(old_data), "ops": ops}
+    data = json.dumps(bundle, indent=1).encode("utf-8")
+    name = f"delta-{version:05d}-{version + 1:05d}.json"
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, name), "wb") as f:
+        f.write(data)
+    manifest["bundles"].append({"file": name, "from": version, "to": version + 1, "sha256": hashlib.sha256(data).hexdigest()})
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return name
+
+def main():
+    # python db_updates.py [SOURCE]                   apply the bundles of SOURCE
+    # python db_updates.py make OLD_DB NEW_DB OUT_DIR [OLD_CATS_ALTS NEW_CATS_ALTS]
+    if len(sys.argv) > 1 and sys.argv[1] == "make":
+        print(f"Written {make_bundle(*sys.argv[2:7])}")
+        return
+    try:
+        applied = apply_updates(sys.argv[1] if len(sys.argv) > 1 else BUNDLE_DIR)
+    except BundleError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Data version {applied[-1]}" if applied else "No update to apply.")
+
+if __name__ == "__main__":
+    main()
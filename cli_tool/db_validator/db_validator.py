@@ -0,0 +1,137 @@
+import gzip
+import html
+import json
+import os
+import re
+from collections import defaultdict
+
+# Coverage of the DB against a local documentation dump, one directory per library named as
+# in Libraries: <docs_dir>/<library>/** (Doxygen/HTML pages, man pages, POD, Markdown, text).
+# Every document is read once into its identifiers and the functions it mentions (an
+# identifier followed by "("); these sets are cached in INDEX_FILE by file size and mtime, so
+# a rerun after a DB rebuild only reads the documents that changed. The coverage is then a
+# few set operations per library instead of a scan of every document for every primitive.
+INDEX_FILE = ".doc_index.json"
+INDEX_FORMAT = 1
+DOC_EXTENSIONS = ('.html', '.htm', '.xml', '.md', '.txt', '.pod', '.rst', '.gz')
+MAN_PAGE_RE = re.compile(r'\.\d[a-z]*$')  # EVP_EncryptInit.3, EVP_EncryptInit.3ssl
+
+IDENTIFIER_RE = re.compile(r'[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*')
+FUNCTION_RE = re.compile(r'([A-Za-z_]\w*(?:::[A-Za-z_]\w*)*)\s*\(')
+POD_CODE_RE = re.compile(r'\b[IBCLFSXZE]<+\s*([^<>]*?)\s*>+')
+ROFF_ESCAPE_RE = re.compile(r'\\f[BIRP]|\\f\(\w\w|\\&')
+TAG_RE = re.compile(r'<[^>]+>')
+NOT_FUNCTIONS = {'if', 'for', 'while', 'switch', 'return', 'sizeof', 'defined', 'void', 'int', 'char'}
+
+def is_document(filename):
+    lower = filename.lower()
+    return lower.endswith(DOC_EXTENSIONS) or bool(MAN_PAGE_RE.search(lower))
+
+def read_document(path):
+    """Plain text of a document: markup, POD formatting codes and roff escapes removed."""
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+    lower = path.lower()
+    if lower.endswith(('.html', '.htm', '.xml')):
+        text = html.unescape(TAG_RE.sub(' ', text))
+    elif lower.endswith('.pod'):
+        text = POD_CODE_RE.sub(r'\1', text)
+    else:
+        text = ROFF_ESCAPE_RE.sub('', text).replace('\\-', '-')
+    return text
+
+def with_last_component(names):
+    """names and the last component of the qualified ones (Botan::Cipher::create -> create)."""
+    out = set(names)
+    out.update(n.rsplit('::', 1)[1] for n in names if '::' in n)
+    return out
+
+def document_terms(path):
+    """(identifiers, functions) of the document at path."""
+    text = read_document(path)
+    identifiers = with_last_component(IDENTIFIER_RE.findall(text))
+    functions = with_last_component(FUNCTION_RE.findall(text)) - NOT_FUNCTIONS
+    return identifiers, functions
+
+def load_index(docs_dir):
+    try:
+        with open(os.path.join(docs_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        return index if index.get('format') == INDEX_FORMAT else {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def index_documents(docs_dir):
+    """
+    Inverted index of the dump: ({identifier: {library, ...}}, {function: {library, ...}}).
+    Only the documents added or changed since the last run are read.
+    """
+    cached = load_index(docs_dir).get('documents', {})
+    documents = {}
+    for library in sorted(os.listdir(docs_dir)):
+        library_dir = os.path.join(docs_dir, library)
+        if not os.path.isdir(library_dir):
+            continue
+        for dirpath, _, filenames in os.walk(library_dir):
+            for filename in filenames:
+                if not is_document(filename):
+                    continue
+                path = os.path.join(dirpath, filename)
+                rel = os.path.relpath(path, docs_dir).replace(os.sep, '/')
+                st = os.stat(path)
+                stamp = [st.st_size, st.st_mtime]
+                entry = cached.get(rel)
+                if not entry or entry['stamp'] != stamp:
+                    identifiers, functions = document_terms(path)
+                    entry = {'library': library, 'stamp': stamp, 'identifiers': sorted(identifiers), 'functions': sorted(functions)}
+                documents[rel] = entry
+    with open(os.path.join(docs_dir, INDEX_FILE + '.tmp'), 'w', encoding='utf-8') as f:
+        json.dump({'format': INDEX_FORMAT, 'documents': documents}, f)
+    os.replace(os.path.join(docs_dir, INDEX_FILE + '.tmp'), os.path.join(docs_dir, INDEX_FILE))
+
+    identifier_index, function_index = defaultdict(set), defaultdict(set)
+    for entry in documents.values():
+        for term in entry['identifiers']:
+            identifier_index[term].add(entry['library'])
+        for term in entry['functions']:
+            function_index[term].add(entry['library'])
+    return identifier_index, function_index
+
+def check_coverage(docs_dir, primitives):
+    """
+    Coverage of the (library, primitive name) rows against the dump in docs_dir.
+    Returns {library: {"primitives", "documented", "coverage", "missing_in_docs",
+    "documented_elsewhere", "missing_in_db"}}: the DB primitives the docs of the library do not
+    mention (and those of them the docs of another library do), and the functions its docs
+    mention that are not in the DB.
+    """
+    identifier_index, function_index = index_documents(docs_dir)
+    db_names = defaultdict(set)
+    for library, name in primitives:
+        db_names[library].add(name)
+    doc_functions = defaultdict(set)
+    for term, libraries in function_index.items():
+        for library in libraries:
+            doc_functions[library].add(term)
+
+    report = {}
+    for library in sorted(set(db_names) | set(doc_functions)):
+        names = db_names[library]
+        documented = {n for n in names if library in identifier_index.get(n, ())}
+        missing = names - documented
+        report[library] = {
+            'primitives': len(names),
+            'documented': len(documented),
+            'coverage': len(documented) / len(names) if names else None,
+            'missing_in_docs': sorted(missing),
+            'documented_elsewhere': sorted(n for n in missing if n in identifier_index),
+            'missing_in_db': sorted(f for f in doc_functions[library] if f.rsplit('::', 1)[-1] not in names),
+        }
+    return report
+
+def print_report(report):
+    print(f"{'Library':<15} {'Primitives':>10} {'Documented':>10} {'Coverage':>9} {'Not in docs':>12} {'Not in DB':>10}")
+    for library, r in report.items():
+        coverage = f"{r['coverage']:.1%}" if r['coverage'] is not None else "-"
+        print(f"{library:<15} {r['primitives']:>10} {r['documented']:>10} {coverage:>9} {len(r['missing_in_docs']):>12} {len(r['missing_in_db']):>10}")
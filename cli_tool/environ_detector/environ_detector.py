@@ -18,12 +18,14 @@ def parse_makefile(filepath):
     libs = set()
     flags = set()
     env_vars = set()
-    pattern_lib = re.compile(r"-l\s*([A-Za-z][A-Za-z0-9_\-]+)\b")
+    pattern_lib = re.compile(r"(?<![-\w])-l\s*([A-Za-z][A-Za-z0-9_\-]+)\b")
     raw = open(filepath, 'r', encoding='utf-8', errors='ignore').read()
     content = raw.replace('\\\n', ' ')
     lines = [l for l in content.split('\n') if any(tok in l for tok in ('LDFLAGS', 'LDLIBS', 'LIBS', '-l'))]
     text = '\n'.join(lines)
     libs.update(pattern_lib.findall(text))
+    for mods in re.findall(r'pkg-config[ \t]+(?:--\S+[ \t]+)*--libs(?:[ \t]+--\S+)*[ \t]+([A-Za-z0-9_.+\- \t]+)', content):
+        libs.update(m for m in mods.split() if not m.startswith('-'))
     flags.update(re.findall(r'(-I[^\s]+|-D[^\s]+|-std=[^\s]+|-W[^\s]+|-O[0-3])', text))
     env_vars.update(re.findall(r'\$\((\w+)\)', content))
     return libs, flags, env_vars
@@ -58,6 +60,9 @@ def parse_cmake(filepath):
             if t.startswith('$') or os.path.sep in t or '/' in t or t.endswith('.lib'):
                 continue
             libs.add(re.sub(r'\$<[^>]+>', '', t))
+    for mods in re.findall(r'pkg_check_modules\s*\(\s*\w+([^)]*)\)', content):
+        libs.update(re.split(r'[<>=]', m)[0] for m in re.split(r'\s+', mods) if m and m not in ('REQUIRED', 'QUIET', 'IMPORTED_TARGET', 'GLOBAL', 'NO_CMAKE_PATH', 'NO_CMAKE_ENVIRONMENT_PATH'))
+    libs.update(re.findall(r'find_package\s*\(\s*([A-Za-z0-9_]+)', content))
     flags.update(re.findall(r'(?:add_compile_options|set\s*\(.*CMAKE_CXX_FLAGS[^\)]*)(-[^\s\)]+)', content, flags=re.DOTALL))
     env_vars.update(re.findall(r'\$ENV\{(\w+)\}', content))
     return libs, flags, env_vars
@@ -107,6 +112,48 @@ def scan_project(path):
         'cmake_present': cmake_present
     }
 
+# Link names (-l), pkg-config modules, find_package() names and CMake targets of each
+# library of the DB, keyed by the lowercase name of its row in the Libraries table (see
+# db_creator_updater/libraries.json). The names are compared exactly after
+# normalize_library_name, so libssh and libssh2 (or ssl and a project's own sslutil) stay apart.
+LIBRARY_LINK_NAMES = {
+    # LibreSSL's libssl and libcrypto implement the OpenSSL API
+    'openssl': {'ssl', 'crypto', 'libssl', 'libcrypto', 'openssl', 'openssl::ssl', 'openssl::crypto', 'libressl', 'libressl::ssl', 'libressl::crypto'},
+    'libssh': {'ssh', 'libssh', 'ssh::ssh'},
+    'libssh2': {'ssh2', 'libssh2', 'libssh2::libssh2', 'libssh2::libssh2_shared', 'libssh2::libssh2_static', 'libssh2_shared', 'libssh2_static'},
+    'libsodium': {'sodium', 'libsodium', 'sodium::sodium', 'unofficial-sodium::sodium'},
+    'wolfssl': {'wolfssl', 'libwolfssl', 'wolfcrypt', 'wolfssl::wolfssl'},
+    'cryptopp': {'cryptopp', 'crypto++', 'libcryptopp', 'libcrypto++', 'cryptopp::cryptopp', 'cryptopp-static', 'cryptopp-shared'},
+    'botan': {'botan', 'botan::botan', 'botan::botan-static'},
+}
+
+def normalize_library_name(name):
+    """
+    Lowercases a link name, pkg-config module, CMake target or library file name and drops
+    what only tells its version: the file suffix (libssl.so.3) and a separated version
+    (botan-2, botan-3). Digits that are part of the name are kept (libssh2, mbedx509, nss3).
+    e.g. 'OpenSSL::Crypto' -> 'openssl::crypto', 'libssl.so.3' -> 'libssl', 'botan-3' -> 'botan'
+    """
+    n = name.strip().lower()
+    n = re.sub(r'\.(so|a|dylib|lib)(\.[0-9.]+)?$', '', n)
+    return re.sub(r'[-_.][0-9][0-9.]*$', '', n)
+
+def library_link_names(name):
+    """Names the Libraries row name is linked with: its LIBRARY_LINK_NAMES entry, or the name itself with and without the lib prefix."""
+    key = normalize_library_name(name)
+    if key in LIBRARY_LINK_NAMES:
+        return LIBRARY_LINK_NAMES[key]
+    return {key, key[3:]} if key.startswith('lib') and len(key) > 3 else {key}
+
+def match_libraries(detected, libraries):
+    """
+    Maps the detected link names (scan_project()['libraries']) to Libraries rows.
+    libraries is a list of (library_id, name); returns the sorted ids of the libraries
+    the project links.
+    """
+    detected = {normalize_library_name(d) for d in detected}
+    return sorted(library_id for library_id, name in libraries if detected & library_link_names(name))
+
 if __name__ == '__main__':
     import json, sys
     root = sys.argv[1] if len(sys.argv) > 1 else '.'
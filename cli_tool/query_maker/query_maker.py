@@ -5,6 +5,11 @@ import json
 import io
 import re
 import textwrap
+import hashlib
+import filecmp
+import itertools
+import threading
+import urllib.request
 from collections import defaultdict
 
 
@@ -15,13 +20,6 @@ OUTPUT_DIR = 'generated_ql_queries'
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 json_path = os.path.join(os.path.dirname(__file__),"..", "utils", "cats_alts.json")
-with open(json_path, "r", encoding="utf-8") as f:
-    cts_data = json.load(f)
-
-ALGOS = cts_data.get("ALGOS", {})
-OPS =  cts_data.get("OPS", {})
-ALTS = cts_data.get("ALTS", {})
-ALTS_CATS = cts_data.get("ALTS_CATS", {})
 
 
 # --- Utility Functions ---
@@ -36,13 +34,6 @@ def flatten_categorized_data(categorized_dict):
                 flat_set.add(item)
     return flat_set
 
-ALL_ALGOS_FLAT = flatten_categorized_data(ALGOS)
-ALL_OPS_FLAT = flatten_categorized_data(OPS)
-
-
-ALL_ALGORITHMS = flatten_categorized_data(ALGOS)
-ALGO_TOKEN_TO_INFO = {}
-
 def build_algo_token_info_map(data, path, info_map):
     if isinstance(data, dict):
         for key, value in data.items():
@@ -51,8 +42,6 @@ def build_algo_token_info_map(data, path, info_map):
         for token in data:
             info_map.setdefault(token, set()).add(tuple(path))
 
-build_algo_token_info_map(ALGOS, [], ALGO_TOKEN_TO_INFO)
-
 def get_alternative(path, alts_dict, alts_cats_dict):
     """Gets the best alternative based on a specific path."""
     current_level = alts_dict
@@ -65,17 +54,131 @@ def get_alternative(path, alts_dict, alts_cats_dict):
     return current_level if isinstance(current_level, str) else alts_cats_dict.get(path[0], "No specific alternative found.")
 
 
-# Return CodeQl query to detect primitives that don't require further analysis on arguments.
-# If necessary specify a list of primitive ids or categories ids to exclude from the query
-def generate_query_no_args(conn, library_ids, excl_categories=None, excl_primitives=None):
+# --- Source scoping ---
+
+# A scope selects the source files analysed by a query:
+#   include      globs on the absolute path, at least one must match (all files when empty)
+#   exclude      globs on the absolute path, none may match
+#   source_root  only files under the source root of the CodeQL database
+# It compiles to an inScope(File) predicate, evaluated once per File and joined
+# to the calls, functions and macros before any name matching.
+REGEXP_SCOPE = {"include": ["*/home*"], "exclude": [], "source_root": False}
+NO_ARGS_SCOPE = {"include": [], "exclude": ["*include*"], "source_root": False}
+
+def make_scope(include=None, exclude=None, source_root=False):
+    return {"include": list(include or []), "exclude": list(exclude or []), "source_root": bool(source_root)}
+
+def glob_to_like(glob):
+    """Translates a glob (*, ?) to a QL matches() pattern (%, _), escaping the literal % and _."""
+    out = []
+    for ch in glob:
+        if ch == "*":
+            if not out or out[-1] != "%":
+                out.append("%")
+        elif ch == "?":
+            out.append("_")
+        elif ch in "%_\\":
+            out.append("\\\\" + ch)
+        elif ch == '"':
+            out.append('\\"')
+        else:
+            out.append(ch)
+    return "".join(out)
+
+def generate_scope_predicate(scope):
+    """Returns the QL inScope(File f) predicate of scope."""
+    conditions = []
+    if scope.get("source_root"):
+        conditions.append("exists(f.getRelativePath())")
+    if scope.get("include"):
+        conditions.append("(" + " or ".join(f'f.getAbsolutePath().matches("{glob_to_like(g)}")' for g in scope["include"]) + ")")
+    for g in scope.get("exclude", []):
+        conditions.append(f'not f.getAbsolutePath().matches("{glob_to_like(g)}")')
+    return (
+        "// Files in the scope of the analysis\n"
+        "predicate inScope(File f) {\n"
+        "  " + (" and\n  ".join(conditions) if conditions else "any()") + "\n"
+        "}\n"
+    )
+
+def parse_scope_flags(args):
+    """
+    Reads --include=GLOB[,GLOB], --exclude=GLOB[,GLOB] and --source-root from args.
+    Returns (scope, remaining args); scope is None when none of the flags is given.
+    """
+    include, exclude, source_root, rest = [], [], False, []
+    for arg in args:
+        if arg.startswith("--include="):
+            include.extend(g for g in arg.split("=", 1)[1].split(",") if g)
+        elif arg.startswith("--exclude="):
+            exclude.extend(g for g in arg.split("=", 1)[1].split(",") if g)
+        elif arg == "--source-root":
+            source_root = True
+        else:
+            rest.append(arg)
+    if not (include or exclude or source_root):
+        return None, rest
+    return make_scope(include, exclude, source_root), rest
+
+# --- Family selection ---
+
+# A selection restricts the algorithm families of the generated queries:
+#   include  category or subcategory names, at least one must name the family (all when empty)
+#   exclude  category or subcategory names, none may name the family
+# The modes of operation are the families of the "ModesofOperation" category of OPS.
+def make_selection(include=None, exclude=None):
+    return {"include": list(include or []), "exclude": list(exclude or [])}
+
+def is_selected(names, selection):
+    """True if the family with the given category/subcategory names belongs to selection."""
+    if selection is None:
+        return True
+    if any(n in selection["exclude"] for n in names):
+        return False
+    return not selection["include"] or any(n in selection["include"] for n in names)
+
+def family_categories(selection):
+    """Categories of the families of selection, computed once per query for category_selected."""
+    return {cat for cat, _sub, _toks, _alt in flatten_algos_families(selection)}
+
+def category_selected(category, selection, categories=None):
+    """
+    True if the DB category is selected, by name or through one of its selected families.
+    categories are the family_categories of selection, computed here when not given.
+    """
+    if selection is None:
+        return True
+    if category in selection["exclude"]:
+        return False
+    if not selection["include"] or category in selection["include"]:
+        return True
+    if categories is None:
+        categories = family_categories(selection)
+    return category in categories
+
+def parse_selection_flags(args):
+    """
+    Reads --include-families=NAME[,NAME] and --exclude-families=NAME[,NAME] from args.
+    Returns (selection, remaining args); selection is None when none of the flags is given.
+    """
+    include, exclude, rest = [], [], []
+    for arg in args:
+        if arg.startswith("--include-families="):
+            include.extend(n.strip() for n in arg.split("=", 1)[1].split(",") if n.strip())
+        elif arg.startswith("--exclude-families="):
+            exclude.extend(n.strip() for n in arg.split("=", 1)[1].split(",") if n.strip())
+        else:
+            rest.append(arg)
+    if not (include or exclude):
+        return None, rest
+    return make_selection(include, exclude), rest
 
-    cursor = conn.cursor()
+# ======== Primitive repository ========
 
-    # SQL query
-    placeholders_libraries = ','.join('?' * len(library_ids))
-    placeholders_excl_categories = ','.join('?' * (len(excl_categories) if excl_categories is not None else 0))
-    placeholders_excl_primitives = ','.join('?' * (len(excl_primitives) if excl_primitives is not None else 0))
-    query = f"""
+# The library ids and the exclusions are bound as JSON arrays expanded by json_each, so
+# every query has one SQL text whatever the number of ids and stays prepared in the
+# statement cache of the connection.
+NO_ARGS_ROWS_SQL = """
     SELECT
         p.name as PrimitiveName,
         c.name as CategoryName,
@@ -83,127 +186,303 @@ def generate_query_no_args(conn, library_ids, excl_categories=None, excl_primiti
     FROM Primitives p
     JOIN Primitive_categories pc ON p.primitive_id = pc.primitive_id
     JOIN Categories c ON pc.category_id = c.category_id
-    WHERE p.library_id IN ({placeholders_libraries}) AND p.need_arg IS NULL AND
-    p.primitive_id NOT IN ({placeholders_excl_primitives}) AND c.category_id NOT IN ({placeholders_excl_categories});
+    WHERE p.library_id IN (SELECT value FROM json_each(?)) AND p.need_arg IS NULL AND
+    p.primitive_id NOT IN (SELECT value FROM json_each(?)) AND c.category_id NOT IN (SELECT value FROM json_each(?))
+    ORDER BY p.name, p.primitive_id, c.category_id
+    """
+
+# One (functionName, argIndex) row per primitive, duplicates removed
+WITH_ARGS_ROWS_SQL = """
+    SELECT DISTINCT
+        p.name as FunctionName,
+        CAST(p.need_arg AS INTEGER) as ArgumentIndex
+    FROM Primitives p
+    WHERE p.library_id IN (SELECT value FROM json_each(?)) AND p.need_arg IS NOT NULL
+    ORDER BY p.name, ArgumentIndex
+    """
+
+PRIMITIVE_ROWS_SQL = """
+    SELECT p.primitive_id, p.name, p.need_arg, p.comment_alternative,
+           c.category_id, c.name, c.comment_alternative_general
+    FROM Primitives p
+    LEFT JOIN Primitive_categories pc ON p.primitive_id = pc.primitive_id
+    LEFT JOIN Categories c ON pc.category_id = c.category_id
+    WHERE p.library_id IN (SELECT value FROM json_each(?))
+    ORDER BY p.primitive_id, c.category_id
+    """
+
+LIBRARIES_SQL = "SELECT library_id, name FROM Libraries ORDER BY library_id"
+
+PRIMITIVE_NAMES_SQL = """
+    SELECT l.name, p.name
+    FROM Primitives p
+    JOIN Libraries l ON l.library_id = p.library_id
+    """
+
+# Search over the primitive_search trigram index (see db_migrations). A MATCH on a quoted
+# phrase finds the substring in any column, "name : phrase" only in the name; text shorter
+# than a trigram falls back to LIKE, which scans the index.
+SEARCH_SQL = """
+    SELECT s.name, s.library, s.categories, s.alternative, p.need_arg
+    FROM primitive_search s
+    JOIN Primitives p ON p.primitive_id = s.rowid
+    WHERE {where}
+    ORDER BY s.name
+    LIMIT ?
     """
+SEARCH_MATCH = "primitive_search MATCH ?"
+SEARCH_PREFIX = "primitive_search MATCH ? AND s.name LIKE ? ESCAPE '\\'"
+SEARCH_SHORT = "(s.name LIKE ? ESCAPE '\\' OR s.library LIKE ? ESCAPE '\\' OR s.categories LIKE ? ESCAPE '\\' OR s.alternative LIKE ? ESCAPE '\\')"
+SEARCH_SHORT_PREFIX = "s.name LIKE ? ESCAPE '\\'"
+SEARCH_LIMIT = 500
 
-    cursor.execute(query,library_ids)
+ROW_BATCH = 512  # Rows fetched at a time while holding the connection lock
+STATEMENT_CACHE_SIZE = 32
 
-    # Fetch all results
-    rows = cursor.fetchall()
+def file_identity(path):
+    """Identity of the file at path, which changes when it is replaced rather than written to."""
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino)
+
+class PrimitiveRepository:
+    """
+    Read-only access to crypto_primitives.db through a single connection, shared by the
+    generators, core.py and the UI worker threads. Each call runs under a lock and the rows
+    are fetched in batches of ROW_BATCH, so iterators of several threads can interleave.
+    With snapshot=True the DB file is copied into :memory: with the backup API and the
+    repository no longer touches the file; refresh() takes a new copy.
+    """
+
+    def __init__(self, db_path=DB_PATH, snapshot=False):
+        self.db_path = os.path.abspath(db_path)
+        self.snapshot = snapshot
+        self.file_id = file_identity(self.db_path)
+        self._lock = threading.RLock()
+        self._cursors = defaultdict(int)  # Open cursors of each connection
+        self._retired = set()  # Replaced connections closed when their last cursor is
+        self._conn = self._connect()
+
+    def _connect(self):
+        # mode=ro: a missing file is an error instead of a new empty DB
+        uri = "file:" + urllib.request.pathname2url(self.db_path) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        if not self.snapshot:
+            return conn
+        memory = sqlite3.connect(":memory:", check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        try:
+            conn.backup(memory)
+        finally:
+            conn.close()
+        return memory
+
+    def refresh(self):
+        """
+        Takes a new snapshot of the DB file. The iterators already started keep the old one,
+        which is closed when the last of them is done.
+        """
+        conn = self._connect()
+        with self._lock:
+            old, self._conn = self._conn, conn
+            self.file_id = file_identity(self.db_path)
+            self._retire(old)
+
+    def close(self):
+        """Closes the connection, once the iterators already started are done."""
+        with self._lock:
+            self._retire(self._conn)
+
+    def _retire(self, conn):
+        # Called under the lock: closed now, or by _rows when its last cursor is closed
+        if self._cursors.get(conn):
+            self._retired.add(conn)
+        else:
+            conn.close()
+
+    def _rows(self, sql, params):
+        with self._lock:
+            conn = self._conn
+            cursor = conn.execute(sql, params)
+            self._cursors[conn] += 1
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(ROW_BATCH)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            with self._lock:
+                cursor.close()
+                self._cursors[conn] -= 1
+                if not self._cursors[conn]:
+                    del self._cursors[conn]
+                    if conn in self._retired:
+                        self._retired.discard(conn)
+                        conn.close()
+
+    def no_args_rows(self, library_ids, excl_categories=None, excl_primitives=None):
+        """(primitive, category, alternative) rows of the no-args primitives, sorted by primitive."""
+        return self._rows(NO_ARGS_ROWS_SQL, (json.dumps(list(library_ids)), json.dumps(list(excl_primitives or [])), json.dumps(list(excl_categories or []))))
+
+    def with_args_rows(self, library_ids):
+        """Distinct (function, argument index) rows of the primitives that need argument analysis."""
+        return self._rows(WITH_ARGS_ROWS_SQL, (json.dumps(list(library_ids)),))
+
+    def primitive_rows(self, library_ids):
+        """Every Primitives row of the libraries joined with its categories (see primitives_digest)."""
+        return self._rows(PRIMITIVE_ROWS_SQL, (json.dumps(list(library_ids)),))
+
+    def libraries(self):
+        """(library_id, name) of every library."""
+        return list(self._rows(LIBRARIES_SQL, ()))
+
+    def primitive_names(self):
+        """(library name, primitive name) of every primitive."""
+        return self._rows(PRIMITIVE_NAMES_SQL, ())
+
+    def search(self, text, prefix=False, limit=SEARCH_LIMIT):
+        """
+        (name, library, categories, alternative, need_arg) of the first limit primitives whose
+        name, library, categories or alternative contain text, case-insensitively, sorted by
+        name. With prefix=True only the names starting with text.
+        """
+        like = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        phrase = '"' + text.replace('"', '""') + '"'
+        if len(text) >= 3 and prefix:
+            where, params = SEARCH_PREFIX, ("name : " + phrase, like + "%")
+        elif len(text) >= 3:
+            where, params = SEARCH_MATCH, (phrase,)
+        elif prefix:
+            where, params = SEARCH_SHORT_PREFIX, (like + "%",)
+        else:
+            where, params = SEARCH_SHORT, ("%" + like + "%",) * 4
+        return list(self._rows(SEARCH_SQL.format(where=where), params + (limit,)))
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+def primitive_repository(db_path=DB_PATH, snapshot=False):
+    """
+    Shared PrimitiveRepository of the DB file at db_path, opened on first use.
+    A file replaced since then (e.g. by update-db) gets a new repository and the previous
+    one is closed.
+    """
+    key = (os.path.abspath(db_path), snapshot)
+    with _repositories_lock:
+        repo = _repositories.get(key)
+        if repo is None or repo.file_id != file_identity(key[0]):
+            if repo is not None:
+                repo.close()
+            repo = _repositories[key] = PrimitiveRepository(db_path, snapshot)
+        return repo
+
+def problem_message(content, fields):
+    """
+    QL expression of the message of a @kind problem result, in the format of the regexp queries:
+    "Vuln content:<content>" then a "<label>:<value>" line per (label, QL expression) of fields.
+    """
+    return " + ".join([f'"Vuln content:" + {content}'] + [f'"\\n{label}:" + {expr}' for label, expr in fields])
+
+# Writes the lines to out separated by " or", or empty when there is none.
+# The lines are consumed one at a time, so a generator keeps the memory use constant.
+def write_disjunction(out, lines, empty):
+    count = 0
+    for line in lines:
+        if count:
+            out.write(" or\n")
+        out.write(line)
+        count += 1
+    if not count:
+        out.write(empty)
+    return count
+
+# Groups the (primitive, category, alternative) rows, sorted by primitive, in one
+# (primitive, "category, ...", alternative) row per alternative of each primitive.
+# The categories left out by selection are dropped. Only the rows of one primitive are held.
+def group_no_args_rows(rows, selection=None):
+    categories = family_categories(selection) if selection is not None else None
+    for primitive, group in itertools.groupby(rows, key=lambda row: row[0]):
+        alt_to_cats = defaultdict(list)
+        for _primitive, category, alternative in group:
+            if category_selected(category, selection, categories):
+                alt_to_cats[alternative].append(category)
+        for alt, cats in alt_to_cats.items():
+            yield primitive, ", ".join(cats), alt
+
+# Writes the CodeQl query to detect primitives that don't require further analysis on arguments to out.
+# The rows are streamed from the repository (see PrimitiveRepository) to out, so the memory use does not depend on the size of the DB.
+# If necessary specify a list of primitive ids or categories ids to exclude from the query
+# scope selects the analysed files (see make_scope), by default the functions outside include paths
+# selection drops the rows of the categories left out by it (see make_selection)
+def write_query_no_args(repo, library_ids, out, excl_categories=None, excl_primitives=None, scope=None, selection=None):
+
+    # Rows sorted so that the rows of a primitive are consecutive
+    rows = repo.no_args_rows(library_ids, excl_categories, excl_primitives)
 
     # Start building the CodeQL content
-    codeql_lines = [
+    out.write("\n".join([
         "/**",
         "* @id cpp/primitives-noargs-analysis",
+        "* @kind problem",
+        "* @problem.severity warning",
         "* @name Crypto primitive",
         "* @description Find cryptographic primitives",
         "*",
         "*/",
         "\nimport cpp\n",
         "predicate getCategory(string name, string category, string alternative) {"
-    ]
+    ]) + "\n")
 
     # Generate the OR-ed predicate clauses
     # Group primitives by name, collecting all their categories and alternatives
-
-    primitive_groups = defaultdict(list)
-    for primitive, category, alternative in rows:
-        primitive_groups[primitive].append((category, alternative))
-
-    for i, (primitive, cat_alt_list) in enumerate(primitive_groups.items()):
-        alt_to_cats = defaultdict(list)
-        for cat, alt in cat_alt_list:
-            alt_to_cats[alt].append(cat)
-        for j, (alt, cats) in enumerate(alt_to_cats.items()):
-            cats_str = ", ".join(cats)
-            line = f'(name = "{primitive}" and category = "{cats_str}" and alternative = "{alt}")'
-            # Add "or" if not the last clause
-            if not (i == len(primitive_groups) - 1 and j == len(alt_to_cats) - 1):
-                line += " or"
-            codeql_lines.append("  " + line)
-    codeql_lines.append("}\n")
-
+    write_disjunction(out, (
+        f'  (name = "{primitive}" and category = "{cats_str}" and alternative = "{alt}")'
+        for primitive, cats_str, alt in group_no_args_rows(rows, selection)
+    ), "  none()")
 
     # Add the main query block
-    codeql_lines.extend([
+    out.write("\n" + "\n".join([
+        "}\n",
+        generate_scope_predicate(scope or NO_ARGS_SCOPE),
         "from Function f, string name, string category, string alternative",
-        'where name = f.getName() and getCategory(name, category, alternative) and not f.getLocation().getFile().getAbsolutePath().matches("%include%")',
-        'select',
-        '  name as vulnContent,',
-        '  category,',
-        '  "" as subCategory,',
-        '  alternative,',
-        '  f.getLocation() as line'
-    ])
-
-    codeql_query = "\n".join(codeql_lines)
-
-    cursor.close()
-    conn.close()
-
-    return codeql_query
+        'where inScope(f.getLocation().getFile()) and name = f.getName() and getCategory(name, category, alternative)',
+        'select f.getLocation(),',
+        '  ' + problem_message("name", [("Category", "category"), ("Alternative", "alternative")])
+    ]))
+    return True
+
+# Return CodeQl query to detect primitives that don't require further analysis on arguments (see write_query_no_args).
+def generate_query_no_args(repo, library_ids, excl_categories=None, excl_primitives=None, scope=None, selection=None):
+    out = io.StringIO()
+    write_query_no_args(repo, library_ids, out, excl_categories, excl_primitives, scope, selection)
+    return out.getvalue()
 
 # Return string for isKnownAlgorithm query
-def returnQueryisKnownAlgorithm():
+def returnQueryisKnownAlgorithm(selection=None):
     query_builder = io.StringIO()
 
     query_builder.write('predicate isKnownAlgorithm(string category, string subCategory, string token, string alternative) {\n')
 
-    category_clauses = []
+    # Families grouped by category, with the alternatives resolved in the compiled taxonomy
+    families_by_category = defaultdict(list)
+    for category, subcategory, tokens, alternative in flatten_algos_families(selection):
+        families_by_category[category].append((subcategory, tokens, alternative))
 
-    # Iterate over each category in ALGOS
-    for category, subcategories in ALGOS.items():
+    category_clauses = []
+    for category, families in families_by_category.items():
 
         subcategory_clauses = []
-        # Iterate over each subcategory
-        for subcategory, value in subcategories.items():
-            # Handle both 2-level and 3-level nesting
-            if isinstance(value, dict):
-                # 3-level nesting: iterate over nested subcategories
-                for nested_sub, tokens in value.items():
-                    # Get alternative from nested structure
-                    specific_alt = ALTS.get(category, {}).get(subcategory, {}).get(nested_sub)
-
-                    # If specific alternative doesn't exist or is "...", use the general one
-                    if not specific_alt or specific_alt == "...":
-                        alternative = ALTS_CATS.get(category, "...")
-                    else:
-                        alternative = specific_alt
-
-                    # Build the condition for tokens
-                    if len(tokens) == 1:
-                        token_condition = f'token = "{tokens[0]}"'
-                    else:
-                        token_parts = [f'token = "{t}"' for t in tokens]
-                        token_condition = f'({" or ".join(token_parts)})'
-
-                    # Build the complete clause for the subcategory
-                    subcategory_clause = f'(subCategory = "{nested_sub}" and {token_condition} and alternative = "{alternative}")'
-                    subcategory_clauses.append(subcategory_clause)
+        for subcategory, tokens, alternative in families:
+            # Build the condition for tokens
+            if len(tokens) == 1:
+                token_condition = f'token = "{tokens[0]}"'
             else:
-                # 2-level nesting: value is the token list
-                tokens = value
-                # Determine the correct alternative
-                # Try to get the specific alternative for the subcategory
-                specific_alt = ALTS.get(category, {}).get(subcategory)
-
-                # If specific alternative doesn't exist or is "...", use the general one
-                if not specific_alt or specific_alt == "...":
-                    alternative = ALTS_CATS.get(category, "...")
-                else:
-                    alternative = specific_alt
-
-                # Build the condition for tokens
-                if len(tokens) == 1:
-                    token_condition = f'token = "{tokens[0]}"'
-                else:
-                    token_parts = [f'token = "{t}"' for t in tokens]
-                    token_condition = f'({" or ".join(token_parts)})'
-
-                # Build the complete clause for the subcategory
-                subcategory_clause = f'(subCategory = "{subcategory}" and {token_condition} and alternative = "{alternative}")'
-                subcategory_clauses.append(subcategory_clause)
+                token_parts = [f'token = "{t}"' for t in tokens]
+                token_condition = f'({" or ".join(token_parts)})'
+
+            # Build the complete clause for the subcategory
+            subcategory_clause = f'(subCategory = "{subcategory}" and {token_condition} and alternative = "{alternative}")'
+            subcategory_clauses.append(subcategory_clause)
 
         # Join the subcategory clauses with "or"
         full_subcategory_block = " or ".join(subcategory_clauses)
@@ -213,18 +492,30 @@ def returnQueryisKnownAlgorithm():
         category_clauses.append(category_clause)
 
     # Join the category blocks with "or"
-    query_builder.write(" or ".join(category_clauses))
+    query_builder.write(" or ".join(category_clauses) if category_clauses else "    none()")
     query_builder.write("\n}\n")
     res = query_builder.getvalue()
     query_builder.close()
     return res
 
-def generate_query_macros():
-    predicate = returnQueryisKnownAlgorithm()
+# Return string for the knownToken table: every token of isKnownAlgorithm once, with its length
+# precomputed, so the longest-token predicates can pick the winner with a max aggregate
+def returnQueryKnownToken(selection=None):
+    tokens = sorted({t for _c, _s, toks, _a in flatten_algos_families(selection) for t in toks}, key=lambda t: (-len(t), t))
+    clauses = [f'    (token = "{t}" and tokenLength = {len(t)})' for t in tokens]
+    return "predicate knownToken(string token, int tokenLength) {\n" + (" or\n".join(clauses) or "    none()") + "\n}\n"
+
+# With per_macro=True one row is reported per macro instead of per invocation,
+# with the number of invocations as an extra column. scope restricts the invocations (all by default),
+# selection the algorithm families (see make_selection).
+def generate_query_macros(per_macro=False, scope=None, selection=None):
+    predicate = returnQueryisKnownAlgorithm(selection)
 
     codeql_lines = [
         "/**",
         " * @id cpp/primitives-macro-analysis",
+        " * @kind problem",
+        " * @problem.severity warning",
         " * @name Insecure cryptographic algorithm specified by macro",
         " * @description Finds an insecure cryptographic algorithm specified as a macro. This query prioritizes the longest matching token to provide the most specific result.",
         " * @tags security",
@@ -234,40 +525,57 @@ def generate_query_macros():
         "",
     ]
     codeql_lines.append(predicate)
+    codeql_lines.append(returnQueryKnownToken(selection))
+    codeql_lines.append(generate_scope_predicate(scope or make_scope()))
 
 
-    # Replace the old longestMatchAlgo + query builder with this:
+    # The tokens are matched once per distinct macro name, then joined to the invocations
     codeql_lines.append("""
+    predicate relevantInvocation(MacroInvocation mi) {
+      inScope(mi.getLocation().getFile())
+    }
+
+    /** Lowercased names of the invoked macros */
+    predicate invokedMacroName(string macName) {
+      exists(MacroInvocation mi | relevantInvocation(mi) and macName = mi.getMacro().getName().toLowerCase())
+    }
+
     /** Does the macro name contain a known token (from any category)? */
-    predicate containsKnownToken(MacroInvocation mi, string token) {
-      exists(string c, string s, string alt |
-        isKnownAlgorithm(c, s, token, alt) and
-        mi.getMacro().getName().toLowerCase().matches("%" + token + "%")
-      )
+    predicate containsKnownToken(string macName, string token) {
+      invokedMacroName(macName) and
+      knownToken(token, _) and
+      macName.matches("%" + token + "%")
     }
 
     /** The globally-longest token from the macro name */
-    predicate longestTokenInMacro(MacroInvocation mi, string token) {
-      containsKnownToken(mi, token) and
-      not exists(string t2 |
-        containsKnownToken(mi, t2) and t2.length() > token.length()
-      )
+    predicate longestTokenInMacro(string macName, string token) {
+      containsKnownToken(macName, token) and
+      knownToken(token, max(string t, int len | containsKnownToken(macName, t) and knownToken(t, len) | len))
     }
 
     """)
 
-    codeql_lines.extend([
-      "from MacroInvocation mi, string token, string category, string subCategory, string alternative",
-      "where",
-      "  longestTokenInMacro(mi, token) and",
-      "  isKnownAlgorithm(category, subCategory, token, alternative)",
-      "select",
-      "  mi.getMacro().getName() as vulnContent,",
-      "  category,",
-      "  subCategory,",
-      "  alternative,",
-      "  mi.getLocation() as line"
-    ])
+    if per_macro:
+        codeql_lines.extend([
+          "from Macro m, string token, string category, string subCategory, string alternative, int invocations",
+          "where",
+          "  longestTokenInMacro(m.getName().toLowerCase(), token) and",
+          "  isKnownAlgorithm(category, subCategory, token, alternative) and",
+          "  invocations = count(MacroInvocation mi | relevantInvocation(mi) and mi.getMacro() = m) and",
+          "  invocations > 0",
+          "select m.getLocation(),",
+          "  " + problem_message("m.getName()", [("Algorithm", "subCategory"), ("Alternative", "alternative"), ("Category", "category"), ("Invocations", "invocations.toString()")])
+        ])
+    else:
+        codeql_lines.extend([
+          "from MacroInvocation mi, string token, string category, string subCategory, string alternative",
+          "where",
+          "  relevantInvocation(mi) and",
+          "  longestTokenInMacro(mi.getMacro().getName().toLowerCase(), token) and",
+          "  isKnownAlgorithm(category, subCategory, token, alternative)",
+          "select mi.getLocation(),",
+          "  " + problem_message("mi.getMacro().getName()", [("Algorithm", "subCategory"), ("Alternative", "alternative"), ("Category", "category")])
+        ])
 
 
     return "\n".join(codeql_lines)
@@ -275,28 +583,18 @@ def generate_query_macros():
 
 
 
-def generate_query_with_args(conn, library_ids):
-    cursor = conn.cursor()
-    placeholders_libraries = ','.join('?' * len(library_ids))
-    query = f"""
-    SELECT
-        p.name as FunctionName,
-        p.need_arg as ArgumentIndex
-    FROM Primitives p
-    WHERE p.library_id IN ({placeholders_libraries}) AND p.need_arg IS NOT NULL
-    """
-    cursor.execute(query, library_ids)
-    functions_with_args = cursor.fetchall()
-
-    if not functions_with_args:
-        return "" # Return empty if no functions need arg analysis
-
-
-    predicate = returnQueryisKnownAlgorithm()
+# Metadata, isKnownAlgorithm and the argument token predicates of the with-args query
+# argument_relation is the (functionName, argIndex) predicate listing the argument positions
+# that carry the algorithm: only those arguments are searched for known tokens.
+# scope restricts the calls (all by default, see make_scope), selection the algorithm families.
+def generate_query_with_args_header(argument_relation="algorithmArgument", scope=None, selection=None):
+    predicate = returnQueryisKnownAlgorithm(selection)
 
     codeql_lines = [
         "/**",
         " * @id cpp/primitives-withargs-analysis",
+        " * @kind problem",
+        " * @problem.severity warning",
         " * @name Insecure cryptographic algorithm specified by argument",
         " * @description Finds function calls that use an insecure cryptographic algorithm specified as an argument. This can be a string, a macro, or a call to a function whose name indicates the algorithm (e.g., OpenSSL's EVP_aes_256_cbc()). This query prioritizes the longest matching token to provide the most specific result.",
         " * @tags security",
@@ -306,58 +604,78 @@ def generate_query_with_args(conn, library_ids):
         "",
     ]
     codeql_lines.append(predicate)
+    codeql_lines.append(returnQueryKnownToken(selection))
+    codeql_lines.append(generate_scope_predicate(scope or make_scope()))
+
+    codeql_lines.append(f"""
+    /** The arguments at the positions given by {argument_relation} */
+    predicate candidateArgument(Expr argValue) {{
+      exists(FunctionCall call, int n |
+        inScope(call.getLocation().getFile()) and
+        {argument_relation}(call.getTarget().getName(), n) and
+        argValue = call.getArgument(n)
+      )
+    }}""")
 
     codeql_lines.append("""
     predicate containsKnownToken(Expr argValue, string token) {
-      exists(string c, string s, string alt |
-        isKnownAlgorithm(c, s, token, alt) and
-        (
-          (argValue instanceof StringLiteral and argValue.(StringLiteral).getValue().toLowerCase().matches("%" + token + "%")) or
-          (argValue instanceof FunctionCall and argValue.(FunctionCall).getTarget().getName().toLowerCase().matches("%" + token + "%")) or
-          (argValue instanceof VariableAccess and argValue.(VariableAccess).getTarget().getName().toLowerCase().matches("%" + token + "%"))
-        )
+      candidateArgument(argValue) and
+      knownToken(token, _) and
+      (
+        (argValue instanceof StringLiteral and argValue.(StringLiteral).getValue().toLowerCase().matches("%" + token + "%")) or
+        (argValue instanceof FunctionCall and argValue.(FunctionCall).getTarget().getName().toLowerCase().matches("%" + token + "%")) or
+        (argValue instanceof VariableAccess and argValue.(VariableAccess).getTarget().getName().toLowerCase().matches("%" + token + "%"))
       )
     }
 
     /** The globally-longest token from the macro name */
     predicate longestTokenInArg(Expr argValue, string token) {
       containsKnownToken(argValue, token) and
-      not exists(string t2 |
-        containsKnownToken(argValue, t2) and t2.length() > token.length()
-      )
-    }
-    boolean isKnownFunction(string functionName) {"""
-    )
+      knownToken(token, max(string t, int len | containsKnownToken(argValue, t) and knownToken(t, len) | len))
+    }""")
+
+    return "\n".join(codeql_lines)
 
+# Writes the with-args query to out, streaming the (functionName, argIndex) rows from the repository.
+# Returns False, without writing anything, when no primitive needs argument analysis.
+def write_query_with_args(repo, library_ids, out, scope=None, selection=None):
+    rows = repo.with_args_rows(library_ids)
+    first = next(rows, None)
 
-    for primitive, index in functions_with_args:
-        line = f'(functionName = "{primitive}" and result = true)'
-        line += " or"
-        codeql_lines.append("  " + line)
-    # Remove the last "or" and close the predicate
-    if codeql_lines[-1].endswith(" or"):
-        codeql_lines[-1] = codeql_lines[-1][:-3]
-    codeql_lines.append("}\n")
+    if first is None:
+        return False # Nothing to write if no functions need arg analysis
 
+    out.write("\n".join([
+        generate_query_with_args_header(scope=scope, selection=selection),
+        "    predicate algorithmArgument(string functionName, int argIndex) {",
+    ]) + "\n")
 
-    codeql_lines.extend([
+    write_disjunction(out, (
+        f'  (functionName = "{primitive}" and argIndex = {index})'
+        for primitive, index in itertools.chain([first], rows)
+    ), "")
+
+    out.write("\n" + "\n".join([
+        "}\n",
         "from FunctionCall call, Expr argValue, string functionName, string token, string category, string subCategory, string alternative, int n",
         "where",
+        "  inScope(call.getLocation().getFile()) and",
         "  functionName = call.getTarget().getName() and",
-        "  isKnownFunction(functionName) = true and",
+        "  algorithmArgument(functionName, n) and",
         "  argValue = call.getArgument(n) and",
         "  longestTokenInArg(argValue, token) and",
         "  isKnownAlgorithm(category, subCategory, token, alternative)",
-        "select",
-        "  argValue.toString() as vulnContent,",
-        "  category,",
-        '  "",',
-        "  alternative,",
-        "  call.getLocation() as line"
-    ])
-
-
-    return "\n".join(codeql_lines)
+        "select call.getLocation(),",
+        "  " + problem_message("argValue.toString()", [("Algorithm", "subCategory"), ("Alternative", "alternative"), ("Category", "category")])
+    ]))
+    return True
+
+# Return the with-args query (see write_query_with_args), empty if no functions need arg analysis
+def generate_query_with_args(repo, library_ids, scope=None, selection=None):
+    out = io.StringIO()
+    if not write_query_with_args(repo, library_ids, out, scope, selection):
+        return ""
+    return out.getvalue()
 
 # ======== Added features (family-grouped + sha[-_]?N + digit-relaxed where needed) ========
 
@@ -365,7 +683,13 @@ def generate_query_with_args(conn, library_ids):
 def cap_form(t: str) -> str:
     return t[:1].upper() + t[1:] if t else t
 
-def with_sep_variants(tokens):
+# Blacklist: bases where numbers represent DIFFERENT algorithms, not variants
+# (e.g., SM2, SM3, SM4 are different algorithms; SHA-1, SHA-2, SHA-3 are different families
+# RC to be precise with RC2/5/6 despite having same alternative
+# Same thing for X25519, X448 and Curve25519, Curve448.
+NO_WILDCARD_BASES = {'sm', 'sha', 'rc', 'x', 'curve'}
+
+def expand_sep_variants(tokens):
     """
     For tokens that end with digits (e.g. sha1, sha256, ed25519) also produces 'base[-_]?digits'.
     Also adds 'base[-_]?[0-9]+' for bases where variants exist, EXCEPT for bases where
@@ -389,12 +713,6 @@ def with_sep_variants(tokens):
         else:
             out.append(t)
 
-    # Blacklist: bases where numbers represent DIFFERENT algorithms, not variants
-    # (e.g., SM2, SM3, SM4 are different algorithms; SHA-1, SHA-2, SHA-3 are different families
-    # RC to be precise with RC2/5/6 despite having same alternative
-    # Same thing for X25519, X448 and Curve25519, Curve448.
-    NO_WILDCARD_BASES = {'sm', 'sha', 'rc', 'x', 'curve'}
-
     for base in bases_with_digits.keys():
         if base not in NO_WILDCARD_BASES:
             out.append(f"{base}[-_]?[0-9]+")
@@ -406,8 +724,36 @@ def with_sep_variants(tokens):
             dedup.append(v)
     return dedup
 
+def with_sep_variants(tokens):
+    """expand_sep_variants, read from the compiled taxonomy for the token lists of its families."""
+    key = tuple(t.lower() for t in tokens)
+    if key in SEP_VARIANTS:
+        return list(SEP_VARIANTS[key])
+    return expand_sep_variants(tokens)
 
-def flatten_algos_families():
+def walk_algos_families(algos, alts, alts_cats):
+    """
+    Yields (names, family) for every family of the ALGOS table algos, where names are the
+    category and subcategory names matched by a selection and family is a flatten_algos_families tuple.
+    """
+    for cat, subs in algos.items():
+        for sub, value in subs.items():
+            # Check if value is a dict (3-level nesting) or list (2-level nesting)
+            if isinstance(value, dict):
+                # 3-level nesting: iterate over nested subcategories
+                for nested_sub, tokens in value.items():
+                    # Get alternative from nested structure
+                    specific = alts.get(cat, {}).get(sub, {}).get(nested_sub)
+                    alt = specific if specific and specific != "..." else alts_cats.get(cat, "...")
+                    yield (cat, sub, nested_sub), (cat, nested_sub, tokens, alt or "...")
+            else:
+                # 2-level nesting: value is the token list
+                tokens = value
+                specific = alts.get(cat, {}).get(sub)
+                alt = specific if specific and specific != "..." else alts_cats.get(cat, "...")
+                yield (cat, sub), (cat, sub, tokens, alt or "...")
+
+def flatten_algos_families(selection=None):
     """
     Returns tuples with this pattern: (cat, sub, tokens, alt)
     Where
@@ -423,40 +769,288 @@ def flatten_algos_families():
     DES is the subcategorization
     des, 3des, tdes, des-x, des3, desx are the tokens
     AES-256 is the alternative
+    With a selection (see make_selection) only the selected families are returned.
+    The families and their alternatives are read from the compiled taxonomy.
     """
-    for cat, subs in ALGOS.items():
-        for sub, value in subs.items():
-            # Check if value is a dict (3-level nesting) or list (2-level nesting)
-            if isinstance(value, dict):
-                # 3-level nesting: iterate over nested subcategories
-                for nested_sub, tokens in value.items():
-                    # Get alternative from nested structure
-                    specific = ALTS.get(cat, {}).get(sub, {}).get(nested_sub)
-                    alt = specific if specific and specific != "..." else ALTS_CATS.get(cat, "...")
-                    yield (cat, nested_sub, tokens, alt or "...")
-            else:
-                # 2-level nesting: value is the token list
-                tokens = value
-                specific = ALTS.get(cat, {}).get(sub)
-                alt = specific if specific and specific != "..." else ALTS_CATS.get(cat, "...")
-                yield (cat, sub, tokens, alt or "...")
+    for names, family in TAXONOMY_FAMILIES:
+        if is_selected(names, selection):
+            yield family
 
-def collect_mode_tokens():
+def collect_mode_tokens(selection=None):
     """
     Extracts all operation modes from the JSON data.
     Example return value ['ecb', 'ctr', 'cbc', 'cfb', 'ofb', 'xts']
     """
-    modes = OPS.get("ModesofOperation", {})
-    return sorted({tok.lower() for toks in modes.values() for tok in toks}, key=lambda s: (-len(s), s))
+    return mode_tokens(OPS, selection)
+
+def mode_tokens(ops, selection=None):
+    """collect_mode_tokens of the OPS table ops."""
+    modes = ops.get("ModesofOperation", {})
+    return sorted({tok.lower() for mode, toks in modes.items() if is_selected(("ModesofOperation", mode), selection) for tok in toks}, key=lambda s: (-len(s), s))
+
+def concatenation_table_of(families, ops, selection=None):
+    """
+    Returns {token: (category, family, alternative)} for the tokens of families and of the
+    modes of operation of ops selected by selection. The first family of a shared token wins.
+    """
+    table = {}
+    for cat, sub, tokens, alt in families:
+        for t in tokens:
+            table.setdefault(t.lower(), (cat, sub, alt))
+    for mode, toks in ops.get("ModesofOperation", {}).items():
+        if is_selected(("ModesofOperation", mode), selection):
+            for t in toks:
+                table.setdefault(t.lower(), ("ModesofOperation", mode, "SAFE"))
+    return table
+
+def concatenation_table(selection=None):
+    """Token table of the concatenated names (see concatenation_table_of) for selection."""
+    if selection is None:
+        return CONCATENATION_TABLE
+    return concatenation_table_of(flatten_algos_families(selection), OPS, selection)
+
+# ======== Compiled taxonomy ========
+
+# cats_alts.json is compiled once into TAXONOMY_ARTIFACT with every structure derived from it:
+# the flat token sets, the token -> paths map, the families with their resolved alternative,
+# the [-_]? variants of their tokens and the concatenation table. The artifact records the
+# SHA-256 of the JSON it was compiled from and is recompiled when the JSON or TAXONOMY_FORMAT
+# changes. The generators read ALGOS/OPS/ALTS/ALTS_CATS and the tables at call time, so after
+# load_taxonomy() the next generation uses the new cats_alts.json without restarting the process.
+TAXONOMY_ARTIFACT = os.path.join(os.path.dirname(__file__), "..", "utils", "cats_alts.compiled.json")
+# Bump when the structure of the artifact or the derivation of its tables changes
+TAXONOMY_FORMAT = "2"
+taxonomy_mtime = None
+
+def compile_taxonomy(data, source_sha256):
+    """Returns the compiled taxonomy artifact of the cats_alts.json content data."""
+    algos = data.get("ALGOS", {})
+    algo_token_to_info = {}
+    build_algo_token_info_map(algos, [], algo_token_to_info)
+    families = list(walk_algos_families(algos, data.get("ALTS", {}), data.get("ALTS_CATS", {})))
+    token_lists = {tuple(t.lower() for t in family[2]): None for _names, family in families}
+    return {
+        "format": TAXONOMY_FORMAT,
+        "source_sha256": source_sha256,
+        "taxonomy": data,
+        "all_algos_flat": sorted(flatten_categorized_data(algos)),
+        "all_ops_flat": sorted(flatten_categorized_data(data.get("OPS", {}))),
+        "algo_token_to_info": {t: sorted(list(p) for p in paths) for t, paths in algo_token_to_info.items()},
+        "families": families,
+        "sep_variants": [[toks, expand_sep_variants(toks)] for toks in token_lists],
+        "concatenation_table": concatenation_table_of([f for _n, f in families], data.get("OPS", {})),
+    }
+
+def load_taxonomy():
+    """(Re)loads cats_alts.json through its compiled artifact, compiling it if missing or stale."""
+    global cts_data, ALGOS, OPS, ALTS, ALTS_CATS, ALL_ALGOS_FLAT, ALL_OPS_FLAT, ALL_ALGORITHMS, ALGO_TOKEN_TO_INFO
+    global TAXONOMY_FAMILIES, SEP_VARIANTS, CONCATENATION_TABLE, taxonomy_mtime
+    mtime = os.path.getmtime(json_path)
+    with open(json_path, "rb") as f:
+        source = f.read()
+    source_sha256 = hashlib.sha256(source).hexdigest()
+
+    compiled = None
+    try:
+        with open(TAXONOMY_ARTIFACT, "r", encoding="utf-8") as f:
+            compiled = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    if not compiled or compiled.get("format") != TAXONOMY_FORMAT or compiled.get("source_sha256") != source_sha256:
+        compiled = compile_taxonomy(json.loads(source.decode("utf-8")), source_sha256)
+        try:
+            with open(TAXONOMY_ARTIFACT + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(compiled, f)
+            os.replace(TAXONOMY_ARTIFACT + ".tmp", TAXONOMY_ARTIFACT)
+        except OSError as e:
+            print(f"Warning: could not write the compiled taxonomy {TAXONOMY_ARTIFACT}: {e}")
+
+    cts_data = compiled["taxonomy"]
+    ALGOS = cts_data.get("ALGOS", {})
+    OPS =  cts_data.get("OPS", {})
+    ALTS = cts_data.get("ALTS", {})
+    ALTS_CATS = cts_data.get("ALTS_CATS", {})
+
+    ALL_ALGOS_FLAT = set(compiled["all_algos_flat"])
+    ALL_OPS_FLAT = set(compiled["all_ops_flat"])
+    ALL_ALGORITHMS = ALL_ALGOS_FLAT
+    ALGO_TOKEN_TO_INFO = {t: {tuple(p) for p in paths} for t, paths in compiled["algo_token_to_info"].items()}
+    TAXONOMY_FAMILIES = [(tuple(n), tuple(f)) for n, f in compiled["families"]]
+    SEP_VARIANTS = {tuple(toks): variants for toks, variants in compiled["sep_variants"]}
+    CONCATENATION_TABLE = {t: tuple(entry) for t, entry in compiled["concatenation_table"].items()}
+    taxonomy_mtime = mtime
+
+def reload_taxonomy_if_changed():
+    """Reloads cats_alts.json if it was modified since the last load. Returns True if reloaded."""
+    if os.path.getmtime(json_path) == taxonomy_mtime:
+        return False
+    load_taxonomy()
+    return True
+
+load_taxonomy()
+
+# ======== Concatenated names ========
+
+# Names made of several algorithms, like the cipher-suite constant
+# TLS1_TXT_RSA_PSK_WITH_ARIA_256_GCM_SHA384, are split on their non-alphanumeric characters.
+# A segment is a part of the name when it is a token of the concatenation table, or becomes
+# one once its trailing digits are dropped (rsa2048 -> rsa). The queries report the names with
+# two parts or more as "Concatenated" by joining their segments to the table, instead of
+# matching every pair of tokens with a regex, and split_concatenated_results splits them back
+# into their algorithms with the same table.
+
+# Longer segments are not split in glued tokens, which bounds the regex of gluedConcatenation
+GLUED_MAX_LENGTH = 64
+
+def split_glued(segment, table):
+    """
+    Tokens of table glued in segment, with digits between them (aes256gcm -> aes256, gcm),
+    or None when segment is not made only of tokens and digits. At each position the digits
+    are skipped and the longest token is taken, without going back: glued_pattern matches
+    the same split with atomic groups, so both stay linear in the length of the segment.
+    """
+    longest = max(map(len, table), default=0)
+    tokens = []
+    i = 0
+    while i < len(segment):
+        if segment[i].isdigit():
+            i += 1
+            continue
+        end = next((end for end in range(min(len(segment), i + longest), i, -1) if segment[i:end] in table), None)
+        if end is None:
+            return None
+        tokens.append(segment[i:end])
+        i = end
+    return tokens
+
+def is_glued_concatenation(segment, table):
+    """
+    True when segment glues at least two tokens and, as the former concatenation regex
+    required, digits come before a letter somewhere in it: aes256gcm is a concatenation,
+    aesgcm is not.
+    """
+    if len(segment) > GLUED_MAX_LENGTH or not re.search(r"[0-9][a-z]", segment):
+        return False
+    return len(split_glued(segment, table) or []) >= 2
+
+def concatenation_parts(name, selection=None):
+    """
+    Returns the parts of name as (segment, category, family, alternative), in order: the
+    segments between non-alphanumeric characters that are a token (with trailing digits
+    dropped, rsa2048 -> rsa), and the tokens of the segments gluing at least two of them.
+    """
+    table = concatenation_table(selection)
+    parts = []
+    for segment in re.split(r"[^a-z0-9]+", name.lower()):
+        if not segment:
+            continue
+        entry = table.get(segment) or table.get(re.sub(r"[0-9]+$", "", segment))
+        if entry:
+            parts.append((segment,) + entry)
+            continue
+        if is_glued_concatenation(segment, table):
+            parts.extend((token,) + table[token] for token in split_glued(segment, table))
+    return parts
+
+def glued_pattern(tokens):
+    """
+    Regex of the segments split_glued splits in at least two tokens. The tokens are tried
+    longest first in atomic groups and the digits and repetitions are possessive, so nothing
+    is ever matched again: sha256 cannot also be tried as sha and 256.
+    """
+    group = "|".join(sorted(tokens, key=lambda t: (-len(t), t)))
+    return f"[0-9]*+(?>{group})[0-9]*+((?>{group})[0-9]*+)++"
+
+def generate_concatenation_predicates(selection=None):
+    """concatenationToken table and matchesConcatenated predicate of the regexp queries."""
+    tokens = sorted(t for t in concatenation_table(selection) if re.fullmatch(r"[a-z0-9]+", t))
+    if not tokens:
+        return textwrap.dedent("""\
+            // Helper predicate for token concatenations: no token selected
+            bindingset[s]
+            predicate matchesConcatenated(string s) {
+              none()
+            }""")
+    return (
+        "// Tokens of the known algorithms and modes, parts of the concatenated names\n"
+        "predicate concatenationToken(string token) {\n" +
+        " or\n".join(f'    token = "{t}"' for t in tokens) +
+        "\n}\n" +
+        textwrap.dedent("""
+            // Segments of s, between non-alphanumeric characters, that are a known token
+            // directly or once their trailing digits are removed (rsa2048 -> rsa)
+            bindingset[s]
+            predicate concatenationPart(string s, int i) {
+              exists(string segment |
+                segment = s.toLowerCase().regexpReplaceAll("[^a-z0-9]+", "_").splitAt("_", i) and
+                (
+                  concatenationToken(segment) or
+                  concatenationToken(segment.regexpReplaceAll("[0-9]+$", ""))
+                )
+              )
+            }
+
+            // Segments of s made of at least two glued tokens, and digits before a letter (aes256gcm)
+            bindingset[s]
+            predicate gluedConcatenation(string s) {
+              exists(int i, string segment |
+                segment = s.toLowerCase().regexpReplaceAll("[^a-z0-9]+", "_").splitAt("_", i) and
+                not concatenationPart(s, i) and
+                segment.length() <= GLUED_MAX_LENGTH and
+                segment.regexpMatch(".*[0-9][a-z].*") and
+                segment.regexpMatch("GLUED_PATTERN")
+              )
+            }
+
+            // Helper predicate for token concatenations: at least two parts
+            bindingset[s]
+            predicate matchesConcatenated(string s) {
+              exists(int i, int j | concatenationPart(s, i) and concatenationPart(s, j) and i < j)
+              or
+              gluedConcatenation(s)
+            }""").replace("GLUED_PATTERN", glued_pattern(tokens)).replace("GLUED_MAX_LENGTH", str(GLUED_MAX_LENGTH))
+    )
 
-# Creates a regex group containing all algorithm tokens and modes, separated by |.
-def conact_group():
-    toks = sorted({t.lower() for _c,_s,toks,_a in flatten_algos_families() for t in toks}, key=lambda s: (-len(s), s))
-    modes = collect_mode_tokens()
-    groups = ["|".join(toks)]
-    if modes:
-        groups.append("|".join(modes))
-    return "|".join([g for g in groups if g])
+def describe_concatenated(name, selection=None):
+    """
+    Returns (algorithm, alternative) of a concatenated name: its families joined by " + ",
+    and the alternative of each one, or None when name has fewer than two parts.
+    """
+    parts = concatenation_parts(name, selection)
+    if len(parts) < 2:
+        return None
+    alternatives = {}
+    for _segment, _category, family, alternative in parts:
+        alternatives.setdefault(family, alternative)
+    algorithm = "Concatenated (" + " + ".join(alternatives) + ")"
+    return algorithm, "; ".join(f"{family}: {alt}" for family, alt in alternatives.items())
+
+def split_concatenated_results(sarif_path, selection=None):
+    """
+    Post-processes the SARIF of the regexp queries: the message of every "Concatenated"
+    result gets the families of its parts as algorithm and the alternative of each one.
+    Returns the number of results rewritten.
+    """
+    with open(sarif_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    rewritten = 0
+    for run in data.get("runs", []):
+        for result in run.get("results", []):
+            text = result.get("message", {}).get("text", "")
+            match = re.match(r"Vuln content:(.*)\nAlgorithm:Concatenated\nAlternative:[^\n]*", text)
+            if not match:
+                continue
+            described = describe_concatenated(match.group(1), selection)
+            if not described:
+                continue
+            algorithm, alternative = described
+            result["message"]["text"] = f"Vuln content:{match.group(1)}\nAlgorithm:{algorithm}\nAlternative:{alternative}" + text[match.end():]
+            rewritten += 1
+    if rewritten:
+        with open(sarif_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(sarif_path + ".tmp", sarif_path)
+    return rewritten
 
 def family_clause_function_name(subcategory: str, tokens, alt: str):
     toks_lower = [t.lower() for t in tokens] # Convert all tokens to lowercase
@@ -492,8 +1086,9 @@ def family_clause_function_name(subcategory: str, tokens, alt: str):
     p6 = f'.*(?<=[A-Z])({lower_group}).*'
     p7 = f'.*(?<=[a-z])({caps})(?=[A-Z]|[0-9]|[^a-zA-Z]|$).*'
 
+    # matchesConcatenated is checked once per name by classifiedFunctionName
     return (
-        f'(not matchesConcatenated(funcName) and ('
+        f'(('
         f' funcName.regexpMatch("{p1}")'
         f' or originalFuncName.regexpMatch("{p2}")'
         f' or originalFuncName.regexpMatch("{p3}")'
@@ -501,7 +1096,7 @@ def family_clause_function_name(subcategory: str, tokens, alt: str):
         f' or originalFuncName.regexpMatch("{p5}")'
         f' or originalFuncName.regexpMatch("{p6}")'
         f' or originalFuncName.regexpMatch("{p7}")'
-        f') and algorithm = "{subcategory}" and alternative = "{alt}" and source = "function_name" and argValue = "" and vulnContent = f.getName() )'
+        f') and algorithm = "{subcategory}" and alternative = "{alt}" )'
     )
 
 def family_clause_argument(subcategory: str, tokens, alt: str):
@@ -519,43 +1114,231 @@ def family_clause_argument(subcategory: str, tokens, alt: str):
         right_boundary = '([^a-zA-Z0-9]|$)'
 
     p1 = f'.*{left_boundary}({lower_group}){right_boundary}.*'
+    # matchesConcatenated is checked once per value by classifiedArgument
+    return (
+        f'(localArgValue.regexpMatch("{p1}") '
+        f'and algorithm = "{subcategory}" and alternative = "{alt}" )'
+    )
+
+# ======== Single-pass family classifier ========
+
+# Lookaround form of the p1..p7 boundaries used by family_clause_function_name.
+# The left boundary '(^|[^a-zA-Z0-9]|[0-9][-_])' only ever inspects the character
+# right before the token, so it is equivalent to '(?<![a-zA-Z0-9])'.
+# Using lookarounds keeps the boundaries out of the matched text, so a regexpFind
+# returns the token itself and its offset inside the identifier.
+SHAPE_LEFT = {
+    1: '(?<![a-zA-Z0-9])',
+    2: '(?<![a-zA-Z0-9])',
+    3: '(?<![a-zA-Z0-9])',
+    4: '(?<![a-zA-Z0-9])',
+    5: '(?<=[a-z])',
+    6: '(?<=[A-Z])',
+    7: '(?<=[a-z])',
+}
+
+def family_shape_alternatives(subcategory: str, tokens):
+    """
+    Returns {shape: (alternatives, right_lookahead)} for a family, where shape is the
+    number of the pattern p1..p7 built by family_clause_function_name.
+    Shape 1 runs on the lowercase name, shapes 2..7 on the original name.
+    """
+    toks_lower = [t.lower() for t in tokens]
+    expanded = with_sep_variants(toks_lower)
+    uppers = [t.upper() for t in toks_lower]
+    caps = [cap_form(t) for t in toks_lower]
+
+    # Same SHA special case as family_clause_function_name
+    right_p1 = '(?![a-zA-Z])'
+    if tokens == ['sha'] or subcategory in ['SHA-1', 'SHA-2', 'SHA-3']:
+        right_p1 = '(?![a-zA-Z0-9])'
+
+    return {
+        1: (expanded, right_p1),
+        2: (expanded, '(?=[A-Z])'),
+        3: (uppers, '(?=[a-z])'),
+        4: (caps, '(?=[A-Z])'),
+        5: (uppers, ''),
+        6: (expanded, ''),
+        # (?=[A-Z]|[0-9]|[^a-zA-Z]|$) accepts anything but a lowercase letter
+        7: (caps, '(?![a-z])'),
+    }
+
+def single_pass_families(families=None, mode_tokens=None):
+    """
+    Returns the (algorithm, alternative, {shape: (alternatives, right_lookahead)}) entries
+    classified by the single-pass query: every family from flatten_algos_families()
+    (or the given subset of it) followed by the modes of operation (collect_mode_tokens()
+    unless given), which only use shape 1.
+    """
+    if families is None:
+        families = flatten_algos_families()
+    if mode_tokens is None:
+        mode_tokens = collect_mode_tokens()
+    entries = []
+    for _cat, sub, tokens, alt in families:
+        entries.append((sub, alt, family_shape_alternatives(sub, tokens)))
+    for m in mode_tokens:
+        entries.append((m.upper(), "SAFE", {1: ([m], '(?![a-zA-Z])')}))
+    return entries
+
+def combined_shape_pattern(shape, families):
+    """
+    Builds the single alternation of every family token for a case-shape.
+    Each alternative carries its own right lookahead and the alternatives are sorted
+    longest first, so at any offset the match covers every shorter family match too.
+    """
+    seen, alternatives = set(), []
+    for _alg, _alt, shapes in families:
+        if shape not in shapes:
+            continue
+        toks, right = shapes[shape]
+        for t in toks:
+            a = f'{t}{right}'
+            if a not in seen:
+                seen.add(a)
+                alternatives.append(a)
+    alternatives.sort(key=lambda s: (-len(s), s))
+    return f'{SHAPE_LEFT[shape]}(' + "|".join(alternatives) + ')'
+
+def generate_single_pass_classifier(families=None, mode_tokens=None):
+    """
+    Returns the QL predicates used by the single-pass mode:
+      shapePattern(shape)            one combined alternation per case-shape
+      tokenAt(s, shape, rest)        rest = s from the offset of each regexpFind match
+      tokenFamily(shape, rest, ...)  lookup of the matched token back to (subcategory, alternative)
+    The lookup anchors each family at the start of rest, so families whose match is a
+    prefix of a longer one (e.g. sha in sha-1) are still reported.
+    """
+    families = single_pass_families(families, mode_tokens)
+    shapes = sorted({s for _a, _b, sh in families for s in sh})
+
+    pattern_clauses = [f'  (shape = {s} and result = "{combined_shape_pattern(s, families)}")' for s in shapes]
+
+    lookup_clauses = []
+    for alg, alt, sh in families:
+        for s, (toks, right) in sorted(sh.items()):
+            lookup_clauses.append(
+                f'  (shape = {s} and rest.regexpMatch("({"|".join(toks)}){right}.*") and algorithm = "{alg}" and alternative = "{alt}")'
+            )
+
     return (
-        f'(not matchesConcatenated(localArgValue) and localArgValue.regexpMatch("{p1}") '
-        f'and algorithm = "{subcategory}" and alternative = "{alt}" and source = "argument" and argValue = localArgValue and vulnContent = localArgValue )'
+        "// Single-pass classifier: one regexpFind per case-shape instead of one regexpMatch per family\n"
+        "string shapePattern(int shape) {\n" + (" or\n".join(pattern_clauses) or "  none()") + "\n}\n\n"
+        "bindingset[s]\n"
+        "predicate tokenAt(string s, int shape, string rest) {\n"
+        "  exists(int offset |\n"
+        "    exists(s.regexpFind(shapePattern(shape), _, offset)) and\n"
+        "    rest = s.suffix(offset)\n"
+        "  )\n"
+        "}\n\n"
+        "bindingset[rest]\n"
+        "predicate tokenFamily(int shape, string rest, string algorithm, string alternative) {\n" +
+        (" or\n".join(lookup_clauses) or "  none()") + "\n}\n\n"
+        "// Shape 1 runs on the lowercase name, shapes 2..7 on the original one\n"
+        "bindingset[lowerName, originalName]\n"
+        "predicate classifyIdentifier(string lowerName, string originalName, string algorithm, string alternative) {\n"
+        "  exists(int shape, string rest |\n"
+        "    (tokenAt(lowerName, shape, rest) and shape = 1 or tokenAt(originalName, shape, rest) and shape != 1) and\n"
+        "    tokenFamily(shape, rest, algorithm, alternative)\n"
+        "  )\n"
+        "}\n"
     )
 
-def generate_query_regexp_calls_and_args():
+# ======== Token pre-filter ========
+
+# Every regex of a family only matches a lowercase value containing a literal part of one
+# of its tokens: the token itself, or for a token ending with digits (see expand_sep_variants)
+# its letters, or its digits when the base takes no other number. The regexp queries check
+# these substrings with matches() first and only run the family regexes on the values that
+# contain one, so the arguments of printf, memcpy, logging... never reach the regexes.
+def prefilter_key(token):
+    """Substring of the lowercase value implied by any match of token and its [-_]? variants."""
+    # Regex operators (e.g. the + of sphincs+) only leave the literal prefix certain
+    token = re.match(r"[-a-z0-9]*", token.lower()).group(0)
+    m = re.fullmatch(r'([a-z]+)(\d+)', token)
+    if not m:
+        return token
+    base, digits = m.group(1), m.group(2)
+    return max(base, digits, key=len) if base in NO_WILDCARD_BASES else base
+
+def prefilter_keys(tokens):
+    """Minimal set of prefilter_key substrings: a key containing another one is dropped."""
+    keys = sorted({prefilter_key(t) for t in tokens}, key=lambda k: (len(k), k))
+    minimal = []
+    for k in keys:
+        if not any(m in k for m in minimal):
+            minimal.append(k)
+    return sorted(minimal)
+
+def generate_prefilter_predicates(tokens):
+    """prefilterToken table and mayContainToken guard for the given tokens (all values when none is literal)."""
+    keys = prefilter_keys(tokens)
+    if not keys or "" in keys:
+        body = "  any()"
+    else:
+        body = "  exists(string key | prefilterToken(key) and s.matches(\"%\" + key + \"%\"))"
+    table = " or\n".join(f'    key = "{glob_to_like(k)}"' for k in keys if k) or "    none()"
+    return (
+        "// Substrings contained by every value a family, mode or concatenation can match\n"
+        "predicate prefilterToken(string key) {\n" + table + "\n}\n\n"
+        "// Cheap guard run before the regexes: the lowercase value contains one of the substrings\n"
+        "bindingset[s]\n"
+        "predicate mayContainToken(string s) {\n" + body + "\n}"
+    )
+
+def drop_concatenated_disjunct(text, var):
+    """Removes the "Concatenated" result line of var and the `or` after it, for the shards without extras."""
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if line.strip().startswith(f'(matchesConcatenated({var}) and algorithm = "Concatenated"'):
+            del lines[i:i + 2]
+            break
+    return "\n".join(lines)
+
+def generate_query_regexp_calls_and_args(single_pass=False, families=None, with_extras=True, scope=None, selection=None):
     """
     Family-grouped version with sha[-_]?N variants and camelCase support.
+    With single_pass=True every family is compiled into one alternation per case-shape
+    and each identifier goes through a single regexpFind per shape (see
+    generate_single_pass_classifier) instead of seven regexpMatch per family.
+    families restricts the query to a subset of flatten_algos_families() (see shard_families);
+    with_extras=False leaves out the modes of operation and the "Concatenated" results.
+    scope selects the analysed files (see make_scope), REGEXP_SCOPE by default, and
+    selection the families, modes and concatenation tokens (see make_selection).
     """
-    mode_tokens = collect_mode_tokens()
-    concat_group = conact_group()
+    if families is None:
+        families = list(flatten_algos_families(selection))
+    mode_tokens = collect_mode_tokens(selection) if with_extras else []
+    prefilter_tokens = [t for _c, _s, toks, _a in families for t in toks] + mode_tokens
+    if with_extras:
+        prefilter_tokens += list(concatenation_table(selection))
 
-    matches_conc = textwrap.dedent(f"""
-        // Helper predicate for token concatenations
-        bindingset[s]
-        predicate matchesConcatenated(string s) {{
-          s.regexpMatch(".*(({concat_group})([-_/0-9]*[a-zA-Z]*)*([^a-zA-Z0-9]|[-_/0-9])+({concat_group})([-_/0-9]*[a-zA-Z]*)*).*")
-        }}
+    matches_conc = "\n" + generate_concatenation_predicates(selection) + "\n\n" + generate_prefilter_predicates(prefilter_tokens) + textwrap.dedent("""
 
         // Helper predicate to detect file paths
         bindingset[s]
-        predicate isFilePath(string s) {{
+        predicate isFilePath(string s) {
           s.regexpMatch(".*\\\\.(c|h|cpp|hpp|cc|hh|cxx|hxx)$") or s.regexpMatch(".*/.*")
-        }}
+        }
     """).rstrip()
 
     fn_clauses = []
     arg_clauses = []
-    for _cat, sub, tokens, alt in flatten_algos_families():
-        fn_clauses.append(family_clause_function_name(sub, tokens, alt))
-        arg_clauses.append(family_clause_argument(sub, tokens, alt))
-
-    # SAFE's
-    for m in mode_tokens:
-        p = f'.*((^|[^a-zA-Z0-9]|[0-9][-_])({m})([^a-zA-Z]|$)).*'
-        fn_clauses.append(f'(not matchesConcatenated(funcName) and funcName.regexpMatch("{p}") and algorithm = "{m.upper()}" and alternative = "SAFE" and source = "function_name" and argValue = "" and vulnContent = f.getName())')
-        arg_clauses.append(f'(not matchesConcatenated(localArgValue) and localArgValue.regexpMatch("{p}") and algorithm = "{m.upper()}" and alternative = "SAFE" and source = "argument" and argValue = localArgValue and vulnContent = localArgValue)')
+    if single_pass:
+        matches_conc += "\n\n" + generate_single_pass_classifier(families, mode_tokens).rstrip()
+        fn_clauses.append('classifyIdentifier(funcName, originalFuncName, algorithm, alternative)')
+        arg_clauses.append('exists(string rest | tokenAt(localArgValue, 1, rest) and tokenFamily(1, rest, algorithm, alternative))')
+    else:
+        for _cat, sub, tokens, alt in families:
+            fn_clauses.append(family_clause_function_name(sub, tokens, alt))
+            arg_clauses.append(family_clause_argument(sub, tokens, alt))
+
+        # SAFE's
+        for m in mode_tokens:
+            p = f'.*((^|[^a-zA-Z0-9]|[0-9][-_])({m})([^a-zA-Z]|$)).*'
+            fn_clauses.append(f'(funcName.regexpMatch("{p}") and algorithm = "{m.upper()}" and alternative = "SAFE")')
+            arg_clauses.append(f'(localArgValue.regexpMatch("{p}") and algorithm = "{m.upper()}" and alternative = "SAFE")')
 
     header = textwrap.dedent("""
         /**
@@ -570,70 +1353,119 @@ def generate_query_regexp_calls_and_args():
         import cpp
     """).lstrip()
 
-    body_start = textwrap.dedent("""
-        from FunctionCall call, Function f, string algorithm, string alternative, string source, string argValue, string vulnContent
-        where
-        call.getLocation().getFile().getAbsolutePath().matches("%/home%") and
-          f = call.getTarget() and
+    # The identifiers are collected and classified once per distinct string,
+    # then joined back to the call sites in the select clause.
+    identifiers = generate_scope_predicate(scope or REGEXP_SCOPE) + textwrap.dedent("""
+        predicate relevantCall(FunctionCall call) {
+          inScope(call.getLocation().getFile())
+        }
+
+        // Lowercased value of an argument that can name an algorithm
+        predicate argumentValue(Expr arg, string localArgValue) {
+          exists(FunctionCall call | relevantCall(call) and arg = call.getAnArgument()) and
           (
-            (
-              exists(string funcName, string originalFuncName |
-                funcName = f.getName().toLowerCase() and
-                originalFuncName = f.getName() |
-                (matchesConcatenated(funcName) and algorithm = "Concatenated" and alternative = "Different algorithms recommended" and source = "function_name" and argValue = "" and vulnContent = f.getName()) or
-    """)
+            (arg instanceof StringLiteral and localArgValue = arg.(StringLiteral).getValue().toLowerCase() and not isFilePath(localArgValue)) or
+            (arg instanceof FunctionCall and localArgValue = arg.(FunctionCall).getTarget().getName().toLowerCase()) or
+            (arg instanceof VariableAccess and localArgValue = arg.(VariableAccess).getTarget().getName().toLowerCase())
+          )
+        }
+
+        // Distinct names of the called functions that pass the pre-filter
+        predicate calledName(string funcName, string originalFuncName) {
+          exists(FunctionCall call |
+            relevantCall(call) and
+            originalFuncName = call.getTarget().getName() and
+            funcName = originalFuncName.toLowerCase()
+          ) and
+          mayContainToken(funcName)
+        }
+
+        // Distinct argument values that pass the pre-filter
+        predicate argumentString(string localArgValue) {
+          argumentValue(_, localArgValue) and
+          mayContainToken(localArgValue)
+        }
+    """).rstrip()
 
-    body_mid = textwrap.dedent("""
-              )
-            ) or
+    classify_fn = textwrap.dedent("""
+        predicate classifiedFunctionName(string originalFuncName, string algorithm, string alternative) {
+          exists(string funcName |
+            calledName(funcName, originalFuncName) and
             (
-              exists(Expr arg, string localArgValue |
-                arg = call.getAnArgument() and
-                (
-                  (arg instanceof StringLiteral and localArgValue = arg.(StringLiteral).getValue().toLowerCase() and not isFilePath(localArgValue)) or
-                  (arg instanceof FunctionCall and localArgValue = arg.(FunctionCall).getTarget().getName().toLowerCase()) or
-                  (arg instanceof VariableAccess and localArgValue = arg.(VariableAccess).getTarget().getName().toLowerCase())
-                ) and
-                argValue = localArgValue and
-                source = "argument" and
-                vulnContent = localArgValue and
-                (
-                  (matchesConcatenated(localArgValue) and algorithm = "Concatenated" and alternative = "Different algorithms recommended") or
-    """)
+              (matchesConcatenated(funcName) and algorithm = "Concatenated" and alternative = "Different algorithms recommended")
+              or
+              (not matchesConcatenated(funcName) and (
+    """).rstrip()
+    if not with_extras:
+        classify_fn = drop_concatenated_disjunct(classify_fn, "funcName")
+
+    classify_arg = textwrap.dedent("""
+              ))
+            )
+          )
+        }
+
+        predicate classifiedArgument(string localArgValue, string algorithm, string alternative) {
+          argumentString(localArgValue) and
+          (
+            (matchesConcatenated(localArgValue) and algorithm = "Concatenated" and alternative = "Different algorithms recommended")
+            or
+            (not matchesConcatenated(localArgValue) and (
+    """).rstrip()
+    if not with_extras:
+        classify_arg = drop_concatenated_disjunct(classify_arg, "localArgValue")
 
     tail = textwrap.dedent("""
-                )
-              )
+            ))
+          )
+        }
+
+        from FunctionCall call, Function f, string algorithm, string alternative, string source, string argValue, string vulnContent
+        where
+          relevantCall(call) and
+          f = call.getTarget() and
+          (
+            (classifiedFunctionName(f.getName(), algorithm, alternative) and source = "function_name" and argValue = "" and vulnContent = f.getName())
+            or
+            exists(Expr arg, string localArgValue |
+              arg = call.getAnArgument() and
+              argumentValue(arg, localArgValue) and
+              classifiedArgument(localArgValue, algorithm, alternative) and
+              source = "argument" and argValue = localArgValue and vulnContent = localArgValue
             )
           )
-select call.getLocation(),
-\"Vuln content:\" + vulnContent + "\\n" + \"Algorithm:\" + algorithm + \"\\n\" + \"Alternative:\" + alternative
+        select call.getLocation(),
+        \"Vuln content:\" + vulnContent + "\\n" + \"Algorithm:\" + algorithm + \"\\n\" + \"Alternative:\" + alternative
 
     """)
 
     return (
-        header + "\n" + matches_conc + "\n\n" +
-        body_start + "\n                or ".join(fn_clauses) + "\n" +
-        body_mid + "\n                  or ".join(arg_clauses) + "\n" +
+        header + "\n" + matches_conc + "\n\n" + identifiers + "\n\n" +
+        classify_fn + "\n        " + "\n        or ".join(fn_clauses or ["none()"]) +
+        classify_arg + "\n      " + "\n      or ".join(arg_clauses or ["none()"]) +
         tail
     )
 
-def generate_query_regexp_macro():
+def generate_query_regexp_macro(families=None, with_extras=True, per_macro=False, scope=None, selection=None):
     """
     Macro: same family logic, on lowercase macName, with sha[-_]?N support.
+    families and with_extras select a shard, as in generate_query_regexp_calls_and_args.
+    Each distinct macro name is classified once and joined back to its invocations;
+    with per_macro=True one result per macro is reported, with its invocation count.
+    scope and selection as in generate_query_regexp_calls_and_args.
     """
-    mode_tokens = collect_mode_tokens()
-    concat_group = conact_group()
+    if families is None:
+        families = list(flatten_algos_families(selection))
+    mode_tokens = collect_mode_tokens(selection) if with_extras else []
 
-    matches_conc = textwrap.dedent(f"""
-        bindingset[s]
-        predicate matchesConcatenated(string s) {{
-          s.regexpMatch(".*(({concat_group})([-_/0-9]*[a-zA-Z]*)*([^a-zA-Z0-9]|[-_/0-9])+({concat_group})([-_/0-9]*[a-zA-Z]*)*).*")
-        }}
-    """).rstrip()
+    prefilter_tokens = [t for _c, _s, toks, _a in families for t in toks] + mode_tokens
+    if with_extras:
+        prefilter_tokens += list(concatenation_table(selection))
+
+    matches_conc = "\n" + generate_concatenation_predicates(selection) + "\n\n" + generate_prefilter_predicates(prefilter_tokens)
 
     macro_clauses = []
-    for _cat, sub, tokens, alt in flatten_algos_families():
+    for _cat, sub, tokens, alt in families:
         toks_lower = [t.lower() for t in tokens]
         expanded = with_sep_variants(toks_lower)
         lower_group = "|".join(expanded)
@@ -647,10 +1479,10 @@ def generate_query_regexp_macro():
             right_bound = '([^a-zA-Z0-9]|$)'
 
         p = f'.*((^|[^a-zA-Z0-9]|[0-9][-_])({lower_group}){right_bound}).*'
-        macro_clauses.append(f'(not matchesConcatenated(macName) and macName.regexpMatch("{p}") and algorithm = "{sub}" and alternative = "{alt}")')
+        macro_clauses.append(f'(macName.regexpMatch("{p}") and algorithm = "{sub}" and alternative = "{alt}")')
     for m in mode_tokens:
         p = f'.*((^|[^a-zA-Z0-9]|[0-9][-_])({m})([^a-zA-Z]|$)).*'
-        macro_clauses.append(f'(not matchesConcatenated(macName) and macName.regexpMatch("{p}") and algorithm = "{m.upper()}" and alternative = "SAFE")')
+        macro_clauses.append(f'(macName.regexpMatch("{p}") and algorithm = "{m.upper()}" and alternative = "SAFE")')
 
     header = textwrap.dedent("""
         /**
@@ -665,85 +1497,621 @@ def generate_query_regexp_macro():
         import cpp
     """).lstrip()
 
-    body = textwrap.dedent("""
-        from MacroInvocation mi, string macName, string algorithm, string alternative
-        where
-        mi.getLocation().getFile().getAbsolutePath().matches("%/home%") and
-        macName = mi.getMacro().getName().toLowerCase() and
+    # The macro names are collected and classified once per distinct string,
+    # then joined back to the invocations (or to the macros with per_macro).
+    body = generate_scope_predicate(scope or REGEXP_SCOPE) + textwrap.dedent("""
+        predicate relevantInvocation(MacroInvocation mi) {
+          inScope(mi.getLocation().getFile())
+        }
+
+        // Distinct lowercased names of the invoked macros that pass the pre-filter
+        predicate invokedMacroName(string macName) {
+          exists(MacroInvocation mi | relevantInvocation(mi) and macName = mi.getMacro().getName().toLowerCase()) and
+          mayContainToken(macName)
+        }
+
+        predicate classifiedMacroName(string macName, string algorithm, string alternative) {
+          invokedMacroName(macName) and
           (
             (matchesConcatenated(macName) and algorithm = "Concatenated" and alternative = "Different algorithms recommended")
             or
-    """)
+            (not matchesConcatenated(macName) and (
+    """).rstrip()
+    if not with_extras:
+        body = drop_concatenated_disjunct(body, "macName")
+
+    if per_macro:
+        select = textwrap.dedent("""
+            from Macro m, string algorithm, string alternative, int invocations
+            where
+              classifiedMacroName(m.getName().toLowerCase(), algorithm, alternative) and
+              invocations = count(MacroInvocation mi | relevantInvocation(mi) and mi.getMacro() = m) and
+              invocations > 0
+            select m.getLocation(),
+            \"Vuln content:\" + m.getName() + "\\n" + \"Algorithm:\" + algorithm + \"\\n\" + \"Alternative:\" + alternative + \"\\n\" + \"Invocations:\" + invocations.toString()
+        """)
+    else:
+        select = textwrap.dedent("""
+            from MacroInvocation mi, string algorithm, string alternative
+            where
+              relevantInvocation(mi) and
+              classifiedMacroName(mi.getMacro().getName().toLowerCase(), algorithm, alternative)
+            select mi.getLocation(),
+            \"Vuln content:\" + mi.getMacro().getName() + "\\n" + \"Algorithm:\" + algorithm + \"\\n\" + \"Alternative:\" + alternative
+        """)
 
     tail = textwrap.dedent("""
+            ))
           )
-    select mi.getLocation(),
-    \"Vuln content:\" + mi.getMacro().getName() + "\\n" + \"Algorithm:\" + algorithm + \"\\n\" + \"Alternative:\" + alternative
+        }
+    """) + select
+
+    return header + "\n" + matches_conc + "\n\n" + body + "\n      " + "\n      or ".join(macro_clauses or ["none()"]) + tail
+
+# ======== Quantum model engine ========
+
+# The experimental crypto model of CodeQL (codeql/quantum, instantiated for C/C++ by
+# experimental.quantum.Language of codeql/cpp-all) models the crypto operations and the
+# algorithms they use as Crypto::AlgorithmNode. This engine classifies those nodes with
+# isKnownAlgorithm instead of matching every function, argument and macro: far fewer
+# candidates, and only the ones the model recognised as an algorithm.
+QUANTUM_QUERY = "query_quantum.ql"
+
+def generate_query_quantum(scope=None, selection=None):
+    """Query classifying the algorithm nodes of the quantum model with ALGOS/ALTS."""
+    return "\n".join([
+        "/**",
+        " * @id cpp/primitives-quantum-analysis",
+        " * @kind problem",
+        " * @problem.severity warning",
+        " * @name Crypto algorithm (quantum model)",
+        " * @description Finds the algorithms modeled by the experimental quantum crypto library and classifies them with the known algorithm families. The longest matching token gives the most specific family.",
+        " * @tags security",
+        " * cryptography",
+        " */",
+        "\nimport cpp",
+        "import experimental.quantum.Language\n",
+        returnQueryisKnownAlgorithm(selection),
+        returnQueryKnownToken(selection),
+        generate_scope_predicate(scope or make_scope()),
+        textwrap.dedent("""\
+            /**
+             * Lower-case names of a modeled algorithm: the raw name as written in the code,
+             * with and without separators, and the name normalised by the model
+             */
+            predicate modeledAlgorithmName(Crypto::AlgorithmNode alg, string name) {
+              inScope(alg.getLocation().getFile()) and
+              (
+                name = alg.getRawAlgorithmName().toLowerCase() or
+                name = alg.getRawAlgorithmName().toLowerCase().regexpReplaceAll("[-_ /]", "") or
+                name = alg.getAlgorithmName().toLowerCase()
+              )
+            }
+
+            predicate containsKnownToken(Crypto::AlgorithmNode alg, string token) {
+              knownToken(token, _) and
+              exists(string name | modeledAlgorithmName(alg, name) and name.matches("%" + token + "%"))
+            }
+
+            /** The longest known token in the names of the algorithm */
+            predicate longestTokenInAlgorithm(Crypto::AlgorithmNode alg, string token) {
+              containsKnownToken(alg, token) and
+              knownToken(token, max(string t, int len | containsKnownToken(alg, t) and knownToken(t, len) | len))
+            }
+        """),
+        "from Crypto::AlgorithmNode alg, string token, string category, string subCategory, string alternative",
+        "where",
+        "  longestTokenInAlgorithm(alg, token) and",
+        "  isKnownAlgorithm(category, subCategory, token, alternative)",
+        "select alg.getLocation(),",
+        "  " + problem_message("alg.getRawAlgorithmName()", [("Algorithm", "subCategory"), ("Alternative", "alternative"), ("Category", "category")])
+    ])
 
-     """)
+# ======== Data extension export ========
+
+# The primitive tables are written as CodeQL data extensions (see dataExtensions in
+# generated_ql_queries/codeql-pack.yml), so the text of the DB-driven queries never changes
+# and CodeQL evaluates the rows as an indexed relation instead of a large disjunction.
+EXTENSION_PACK = "getting-started/codeql-extra-queries-cpp"
+PRIMITIVES_LIBRARY = "CryptoPrimitives.qll"
+# The rows of every library go to their own extension file, all loaded by the ext/*.model.yml
+# glob of the pack: editing the primitives of one library rebuilds only its file.
+def library_extension_filename(library_id):
+    return os.path.join("ext", f"crypto_primitives.lib{int(library_id)}.model.yml")
+
+def library_extension_files(output_dir):
+    """The per-library extension files present in output_dir, and the former single crypto_primitives.model.yml."""
+    ext_dir = os.path.join(output_dir, "ext")
+    if not os.path.isdir(ext_dir):
+        return []
+    pattern = re.compile(r"crypto_primitives(\.lib\d+)?\.model\.yml")
+    return [os.path.join("ext", name) for name in sorted(os.listdir(ext_dir)) if pattern.fullmatch(name)]
+
+def generate_primitives_library():
+    return textwrap.dedent("""
+        /** Primitive tables exported from crypto_primitives.db as data extensions. */
+
+        /** Primitives identified by their name alone (Primitives.need_arg IS NULL). */
+        extensible predicate noArgsPrimitive(string name, string category, string alternative);
+
+        /** Primitives whose algorithm is given by the argument at argIndex. */
+        extensible predicate withArgsPrimitive(string name, int argIndex);
+    """).lstrip()
+
+def generate_query_no_args_ext(scope=None):
+    """Same results as generate_query_no_args, reading the primitives from noArgsPrimitive."""
+    return "\n".join([
+        "/**",
+        "* @id cpp/primitives-noargs-analysis",
+        "* @kind problem",
+        "* @problem.severity warning",
+        "* @name Crypto primitive",
+        "* @description Find cryptographic primitives",
+        "*",
+        "*/",
+        "\nimport cpp",
+        "import CryptoPrimitives\n",
+        generate_scope_predicate(scope or NO_ARGS_SCOPE),
+        "from Function f, string name, string category, string alternative",
+        'where inScope(f.getLocation().getFile()) and name = f.getName() and noArgsPrimitive(name, category, alternative)',
+        'select f.getLocation(),',
+        '  ' + problem_message("name", [("Category", "category"), ("Alternative", "alternative")])
+    ])
+
+def generate_query_with_args_ext(scope=None, selection=None):
+    """Same results as generate_query_with_args, reading the functions from withArgsPrimitive."""
+    query = generate_query_with_args_header("withArgsPrimitive", scope, selection)
+    query = query.replace("\nimport cpp\n", "\nimport cpp\nimport CryptoPrimitives\n", 1)
+    return "\n".join([
+        query + "\n",
+        "from FunctionCall call, Expr argValue, string functionName, string token, string category, string subCategory, string alternative, int n",
+        "where",
+        "  inScope(call.getLocation().getFile()) and",
+        "  functionName = call.getTarget().getName() and",
+        "  withArgsPrimitive(functionName, n) and",
+        "  argValue = call.getArgument(n) and",
+        "  longestTokenInArg(argValue, token) and",
+        "  isKnownAlgorithm(category, subCategory, token, alternative)",
+        "select call.getLocation(),",
+        "  " + problem_message("argValue.toString()", [("Algorithm", "subCategory"), ("Alternative", "alternative"), ("Category", "category")])
+    ])
+
+def write_primitives_extension(repo, library_ids, out, selection=None):
+    """
+    Writes the data extension YAML with the rows of the no-args and with-args primitives to out,
+    streaming them from the repository. The no-args rows of the categories left out by selection are dropped.
+    """
+    rows = repo.no_args_rows(library_ids)
+
+    out.write("\n".join([
+        "extensions:",
+        "  - addsTo:",
+        f"      pack: {EXTENSION_PACK}",
+        "      extensible: noArgsPrimitive",
+        "    data:",
+    ]))
+    # Same grouping as write_query_no_args: one row per (primitive, alternative)
+    count = 0
+    for n, c, a in group_no_args_rows(rows, selection):
+        out.write(f"\n      - [{json.dumps(n)}, {json.dumps(c)}, {json.dumps(a)}]")
+        count += 1
+    if not count:
+        out.write(" []")
+
+    rows = repo.with_args_rows(library_ids)
+    first = next(rows, None)
+
+    out.write("\n" + "\n".join([
+        "  - addsTo:",
+        f"      pack: {EXTENSION_PACK}",
+        "      extensible: withArgsPrimitive",
+        "    data:" + ("" if first else " []"),
+    ]))
+    if first:
+        for n, i in itertools.chain([first], rows):
+            out.write(f"\n      - [{json.dumps(n)}, {int(i)}]")
+    out.write("\n")
+    return True
+
+def generate_primitives_extension(repo, library_ids, selection=None):
+    """Returns the data extension YAML written by write_primitives_extension."""
+    out = io.StringIO()
+    write_primitives_extension(repo, library_ids, out, selection)
+    return out.getvalue()
+
+# ======== Generation cache ========
+
+# Bump when the text emitted by any generator changes, so that cached .ql files are rebuilt
+GENERATOR_VERSION = "15"
+CACHE_MANIFEST = ".generation_cache.json"
+
+# Every file depends only on the part of the taxonomy and of the DB it reads: the families
+# it classifies (tokens and resolved alternative, see families_digest) and the Primitives rows
+# of its libraries (see primitives_digest). Editing one family of cats_alts.json rebuilds the
+# files containing it and leaves the other ones, and their CodeQL compilation cache, untouched.
+def families_digest(families, mode_tokens=()):
+    """Hash of the taxonomy entries a generated file reads: its families and mode tokens."""
+    h = hashlib.sha256()
+    for family in families:
+        h.update(repr(tuple(family)).encode("utf-8"))
+    h.update(repr(tuple(mode_tokens)).encode("utf-8"))
+    return h.hexdigest()
+
+def taxonomy_digest(selection=None):
+    """families_digest of every family and mode of operation selected by selection."""
+    return families_digest(flatten_algos_families(selection), collect_mode_tokens(selection))
+
+def primitives_digest(repo, library_ids):
+    """Hash of the Primitives/Categories rows the DB-driven generators read for library_ids."""
+    h = hashlib.sha256()
+    for row in repo.primitive_rows(library_ids):
+        h.update(repr(tuple(row)).encode("utf-8"))
+    return h.hexdigest()
+
+def generation_key(query_name, *parts):
+    """Key of a generated query: generator version and the given inputs."""
+    h = hashlib.sha256()
+    for part in (GENERATOR_VERSION, query_name) + parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def load_cache_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, CACHE_MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_cache_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, CACHE_MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def stream_query_cached(output_dir, filename, key, write):
+    """
+    Streams the query written by write(f) to output_dir/filename, unless the file exists
+    and was generated from the same key: then write() is not called at all.
+    The query goes to a temporary file first, so it is never held in memory. A regenerated
+    query identical to the file on disk does not replace it, so the mtime stays untouched
+    and the CodeQL compilation cache keeps hitting.
+    Returns (path, reused): reused is True when the file on disk was left untouched,
+    path is None when write() returned False (no query).
+    """
+    path = os.path.join(output_dir, filename)
+    manifest = load_cache_manifest(output_dir)
+    if manifest.get(filename) == key and os.path.exists(path):
+        return path, True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        written = write(f)
+    if not written:
+        os.remove(path + ".tmp")
+        if manifest.pop(filename, None) is not None:
+            save_cache_manifest(output_dir, manifest)
+        return None, False
+
+    reused = os.path.exists(path) and filecmp.cmp(path + ".tmp", path, shallow=False)
+    if reused:
+        os.remove(path + ".tmp")
+    else:
+        os.replace(path + ".tmp", path)
+
+    manifest[filename] = key
+    save_cache_manifest(output_dir, manifest)
+    return path, reused
+
+def remove_generated(output_dir, filenames):
+    """Removes generated files of output_dir and their cache manifest entries."""
+    if not filenames:
+        return
+    manifest = load_cache_manifest(output_dir)
+    for name in filenames:
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+        manifest.pop(name, None)
+    save_cache_manifest(output_dir, manifest)
+
+def text_writer(generate):
+    """Adapts a generate() returning the query text (empty for no query) to the write(f) of stream_query_cached."""
+    def write(f):
+        query = generate()
+        f.write(query)
+        return bool(query)
+    return write
+
+def write_query_cached(output_dir, filename, key, generate):
+    """stream_query_cached for a generate() returning the query text."""
+    return stream_query_cached(output_dir, filename, key, text_writer(generate))
+
+def generate_all_queries(db_path, library_ids, output_dir=OUTPUT_DIR, single_pass=False, data_extensions=False, shards=None, shard_by="category", per_macro=False, scope=None, selection=None, quantum=False):
+    """
+    Generates the five queries into output_dir through the generation cache.
+    The DB is only read to compute the keys unless the primitives actually changed.
+    With data_extensions=True the no-args and with-args queries have a fixed text and the
+    primitive rows go to one data extension file per library instead (see
+    library_extension_filename); the files of the libraries not in library_ids are removed.
+    With shards set the regexp queries are also written in that many shards (see
+    write_regexp_shards); shards=None regenerates the shards on disk with the shard count and
+    split they were written with, so they never lag behind the single regexp queries.
+    Only the files whose families (see families_digest) or DB rows changed are rebuilt.
+    With per_macro=True the macro queries report one result per macro (see generate_query_macros).
+    scope selects the analysed files of every query (see make_scope); None keeps the
+    default scope of each generator. selection restricts the algorithm families (see make_selection).
+    With quantum=True QUANTUM_QUERY is written as well (see generate_query_quantum).
+    Returns {filename: (path, reused)}.
+    """
+    repo = primitive_repository(db_path)
+    library_key = sorted(library_ids)
+    taxonomy_key = taxonomy_digest(selection)
+    # The no-args rows only depend on the taxonomy through the family names of the selection
+    noargs_taxonomy_key = taxonomy_key if selection is not None else None
+
+    def from_db(writer, **kwargs):
+        # The DB writers stream their rows from the shared repository to the file
+        return lambda f: writer(repo, library_ids, f, **kwargs)
+
+    if data_extensions:
+        jobs = [
+            (library_extension_filename(library_id), (library_id, primitives_digest(repo, [library_id]), noargs_taxonomy_key),
+             lambda f, ids=[library_id]: write_primitives_extension(repo, ids, f, selection=selection))
+            for library_id in library_key
+        ]
+        wanted = {filename for filename, _parts, _write in jobs}
+        remove_generated(output_dir, [name for name in library_extension_files(output_dir) if name not in wanted])
+        jobs += [
+            (PRIMITIVES_LIBRARY, (), text_writer(generate_primitives_library)),
+            ("query_noargs.ql", (data_extensions,), text_writer(lambda: generate_query_no_args_ext(scope=scope))),
+            ("query_withargs.ql", (data_extensions, taxonomy_key), text_writer(lambda: generate_query_with_args_ext(scope=scope, selection=selection))),
+        ]
+    else:
+        rows_digest = primitives_digest(repo, library_ids)
+        jobs = [
+            ("query_noargs.ql", (library_key, rows_digest, noargs_taxonomy_key), from_db(write_query_no_args, scope=scope, selection=selection)),
+            ("query_withargs.ql", (library_key, rows_digest, taxonomy_key), from_db(write_query_with_args, scope=scope, selection=selection)),
+        ]
+    jobs += [
+        ("query_macro.ql", (per_macro, taxonomy_key), text_writer(lambda: generate_query_macros(per_macro=per_macro, scope=scope, selection=selection))),
+        ("query_regexp_calls_and_args.ql", (single_pass, taxonomy_key), text_writer(lambda: generate_query_regexp_calls_and_args(single_pass=single_pass, scope=scope, selection=selection))),
+        ("query_regexp_macro.ql", (per_macro, taxonomy_key), text_writer(lambda: generate_query_regexp_macro(per_macro=per_macro, scope=scope, selection=selection))),
+    ]
+    if quantum:
+        jobs.append((QUANTUM_QUERY, (taxonomy_key,), text_writer(lambda: generate_query_quantum(scope=scope, selection=selection))))
+    results = {}
+    for filename, parts, write in jobs:
+        results[filename] = stream_query_cached(output_dir, filename, generation_key(filename, scope, selection, *parts), write)
+    if shards is None:
+        settings = load_cache_manifest(output_dir).get(SHARD_SETTINGS)
+        if settings:
+            shards, shard_by = settings["n"], settings["by"]
+        elif any(shard_files(output_dir, q) for q in SHARDED_QUERIES):
+            # Shards of unknown settings: removed, so that the single queries are run
+            shards = 0
+    if shards is not None:
+        results.update(write_regexp_shards(output_dir, shards, shard_by, single_pass=single_pass, per_macro=per_macro, scope=scope, selection=selection))
+    return results
+
+# ======== Query shards ========
+
+# The regexp queries can be split in shards, each one classifying a subset of the algorithm
+# families. The shards are listed in the analysis suite in place of their query (see
+# suite_queries) and evaluated together by its single `codeql database analyze`.
+SHARDED_QUERIES = ("query_regexp_calls_and_args.ql", "query_regexp_macro.ql")
+SHARD_SETTINGS = ".shards"  # Cache manifest entry with the shard count and split of the shards on disk
+
+def shard_filename(query_file, index):
+    return f"{os.path.splitext(query_file)[0]}.shard{index}.ql"
+
+def shard_files(output_dir, query_file):
+    """Returns the shard filenames of query_file present in output_dir, in shard order."""
+    pattern = re.compile(re.escape(os.path.splitext(query_file)[0]) + r"\.shard(\d+)\.ql")
+    found = []
+    if os.path.isdir(output_dir):
+        for name in os.listdir(output_dir):
+            match = pattern.fullmatch(name)
+            if match:
+                found.append((int(match.group(1)), name))
+    return [name for _i, name in sorted(found)]
+
+def family_cost(tokens):
+    """Estimated evaluation cost of a family: the alternatives of its patterns."""
+    return len(with_sep_variants([t.lower() for t in tokens]))
+
+def shard_families(n, by="category", selection=None):
+    """
+    Splits flatten_algos_families(selection) in at most n non-empty shards.
+    by="category" keeps every ALGOS category in one shard, by="cost" balances single
+    families on family_cost. Both assign the most expensive unit first to the lightest shard.
+    by="family" ignores n and makes one shard per family, in taxonomy order: editing a family
+    then rebuilds only its shard.
+    Shard 0 also carries the modes of operation and the "Concatenated" results, whose
+    cost is counted in its initial load.
+    """
+    if by == "family":
+        return [[family] for family in flatten_algos_families(selection)] or [[]]
+    units = defaultdict(list)
+    for family in flatten_algos_families(selection):
+        cat, sub, _tokens, _alt = family
+        units[cat if by == "category" else (cat, sub)].append(family)
+
+    shards = [[] for _ in range(max(1, n))]
+    loads = [0] * len(shards)
+    loads[0] = len(collect_mode_tokens(selection))
+    for unit in sorted(units.values(), key=lambda fs: -sum(family_cost(f[2]) for f in fs)):
+        i = loads.index(min(loads))
+        shards[i].extend(unit)
+        loads[i] += sum(family_cost(f[2]) for f in unit)
+    return [shards[0]] + [s for s in shards[1:] if s]
+
+def write_regexp_shards(output_dir, n, by="category", single_pass=False, per_macro=False, scope=None, selection=None):
+    """
+    Writes n shards of each regexp query through the generation cache and removes the
+    shards left over from a previous run with more shards (n=0 removes all of them).
+    n and by are recorded in the cache manifest for the next generate_all_queries.
+    A shard is keyed on its own families, plus every token and mode for shard 0 (which
+    matches the concatenations), so it is only rebuilt when one of them changes.
+    Returns {filename: (path, reused)}.
+    """
+    results = {}
+    shards = shard_families(n, by, selection) if n > 0 else []
+    all_tokens = sorted(concatenation_table(selection).items())
+    for query_file in SHARDED_QUERIES:
+        wanted = set()
+        for i, families in enumerate(shards):
+            filename = shard_filename(query_file, i)
+            wanted.add(filename)
+            if query_file == "query_regexp_macro.ql":
+                generate = lambda f=families, e=(i == 0): generate_query_regexp_macro(families=f, with_extras=e, per_macro=per_macro, scope=scope, selection=selection)
+            else:
+                generate = lambda f=families, e=(i == 0): generate_query_regexp_calls_and_args(single_pass=single_pass, families=f, with_extras=e, scope=scope, selection=selection)
+            extras_key = (all_tokens, collect_mode_tokens(selection)) if i == 0 else None
+            key = generation_key(filename, single_pass, per_macro, scope, selection, families_digest(families), extras_key)
+            results[filename] = write_query_cached(output_dir, filename, key, generate)
+
+        remove_generated(output_dir, [name for name in shard_files(output_dir, query_file) if name not in wanted])
+
+    manifest = load_cache_manifest(output_dir)
+    if shards:
+        manifest[SHARD_SETTINGS] = {"n": n, "by": by}
+    else:
+        manifest.pop(SHARD_SETTINGS, None)
+    save_cache_manifest(output_dir, manifest)
+    return results
+
+# ======== Query suites ========
+
+# The queries of an analysis are listed in a .qls suite of the generated pack and run by a
+# single `codeql database analyze`: the database is loaded and the predicates the queries
+# share are evaluated once, and the SARIF is written directly, without a JVM per query for
+# `query run`, `bqrs interpret` and `github merge-results`.
+ANALYSIS_SUITE = "crypto_analysis.qls"
+SCAN_SUITE = "crypto_scan.qls"
+
+def suite_queries(output_dir, query_files):
+    """query_files present in output_dir, each sharded query replaced by its shards (see shard_files)."""
+    queries = []
+    for query_file in query_files:
+        shards = shard_files(output_dir, query_file)
+        if shards:
+            queries.extend(shards)
+        elif os.path.exists(os.path.join(output_dir, query_file)):
+            queries.append(query_file)
+    return queries
+
+def generate_query_suite(query_files, description):
+    lines = [f"- description: {description}"]
+    lines += [f"- query: {name}" for name in query_files]
+    return "\n".join(lines) + "\n"
+
+def write_query_suite(output_dir, suite_name, query_files, description="Crypto primitives analysis"):
+    """Writes the suite_name suite of query_files to output_dir (the pack root) and returns its path."""
+    path = os.path.join(output_dir, suite_name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(generate_query_suite(query_files, description))
+    os.replace(path + ".tmp", path)
+    return path
+
+def analyze_command(database_path, suite_path, sarif_path):
+    """
+    `codeql database analyze` of the suite on every core. --rerun since the generated queries
+    keep their names when regenerated; the evaluator cache still reuses unchanged predicates.
+    """
+    return [
+        "codeql", "database", "analyze",
+        "--threads=0", "--rerun",
+        "--format=sarifv2.1.0",
+        f"--output={sarif_path}",
+        database_path, suite_path
+    ]
+
+def analysis_bqrs_path(database_path, query_file):
+    """Results of query_file left in the database by `codeql database analyze` (or run-queries)."""
+    return os.path.join(database_path, "results", *EXTENSION_PACK.split("/"), f"{os.path.splitext(query_file)[0]}.bqrs")
 
-    return header + "\n" + matches_conc + "\n\n" + body + "\n            or ".join(macro_clauses) + "\n" + tail
 # ======== Fine added features ========
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python query_maker.py <library_id_1> [<library_id_2> ...]")
+        print("Usage: python query_maker.py [--single-pass] [--data-extensions] [--shards=N] [--shard-by=category|cost|family] [--per-macro] [--quantum] [--include=GLOB,...] [--exclude=GLOB,...] [--source-root] [--include-families=NAME,...] [--exclude-families=NAME,...] <library_id_1> [<library_id_2> ...]")
         print("Example: python query_maker.py 1 3")
+        print("Example: python query_maker.py --include=/build/* --exclude=*/third_party/* 1 3")
+        sys.exit(1)
+    flags = {arg for arg in sys.argv[1:] if arg.startswith('--')}
+    single_pass = '--single-pass' in flags
+    per_macro = '--per-macro' in flags
+    quantum = '--quantum' in flags
+    scope, _ = parse_scope_flags(sys.argv[1:])
+    selection, _ = parse_selection_flags(sys.argv[1:])
+    options = dict(flag[2:].split('=', 1) for flag in flags if '=' in flag)
+    try:
+        shards = int(options['shards']) if 'shards' in options else None
+    except ValueError:
+        print("Error: --shards must be an integer.")
         sys.exit(1)
+    shard_by = options.get('shard-by', 'category')
+    if shard_by not in ('category', 'cost', 'family'):
+        print("Error: --shard-by must be 'category', 'cost' or 'family'.")
+        sys.exit(1)
+    if shard_by == 'family' and shards is None:
+        # One shard per family, whatever the count
+        shards = 1
+    if '--data-extensions' in flags:
+        try:
+            library_ids = [int(arg) for arg in sys.argv[1:] if arg not in flags]
+        except ValueError:
+            print("Error: All provided library IDs must be valid integers.")
+            sys.exit(1)
+        results = generate_all_queries(DB_PATH, library_ids, OUTPUT_DIR, single_pass=single_pass, data_extensions=True, shards=shards, shard_by=shard_by, per_macro=per_macro, scope=scope, selection=selection, quantum=quantum)
+        for filename, (path, reused) in results.items():
+            print(f"{'Up to date' if reused else 'Generated'}: {path or filename}")
+        return
     try:
-        library_ids = [int(arg) for arg in sys.argv[1:]]
+        library_ids = [int(arg) for arg in sys.argv[1:] if arg not in flags]
     except ValueError:
         print("Error: All provided library IDs must be valid integers.")
         sys.exit(1)
 
+    try:
+        repo = primitive_repository(DB_PATH)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error opening the database {DB_PATH}: {e}")
+        sys.exit(1)
+
     # --- Generate Query for Primitives WITHOUT Arguments ---
-    conn_no_args = None
     try:
-        conn_no_args = sqlite3.connect(DB_PATH)
-        conn_no_args.row_factory = sqlite3.Row
-        query_noargs = generate_query_no_args(conn_no_args, library_ids)
+        filename = os.path.join(OUTPUT_DIR, "query_noargs.ql")
+        with open(filename, 'w', encoding='utf-8') as f:
+            write_query_no_args(repo, library_ids, f, scope=scope, selection=selection)
         print("-" * 60)
-        if not query_noargs:
-            print("No primitives found for the 'no-args' query or failed to generate.")
-        else:
-            filename = os.path.join(OUTPUT_DIR, "query_noargs.ql")
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(query_noargs)
-            print(f"Generated: {filename}")
+        print(f"Generated: {filename}")
     except sqlite3.Error as e:
         print(f"Database error occurred during 'no-args' query generation: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-    finally:
-        if conn_no_args:
-            conn_no_args.close()
 
     # --- Generate Query for Primitives WITH Arguments ---
-    conn_with_args = None
     try:
-        conn_with_args = sqlite3.connect(DB_PATH)
-        conn_with_args.row_factory = sqlite3.Row
-        query_with_args = generate_query_with_args(conn_with_args, library_ids)
+        filename_args = os.path.join(OUTPUT_DIR, "query_with_args.ql")
+        with open(filename_args, 'w', encoding='utf-8') as f:
+            written = write_query_with_args(repo, library_ids, f, scope=scope, selection=selection)
         print("-" * 60)
-        if not query_with_args:
+        if not written:
+             os.remove(filename_args)
              print("No primitives found for the 'with-args' query or failed to generate.")
         else:
-            filename_args = os.path.join(OUTPUT_DIR, "query_with_args.ql")
-            with open(filename_args, 'w', encoding='utf-8') as f:
-                f.write(query_with_args)
             print(f"Generated: {filename_args}")
     except sqlite3.Error as e:
         print(f"Database error occurred during 'with-args' query generation: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-    finally:
-        if conn_with_args:
-            conn_with_args.close()
 
     print("-" * 60)
 
     # --- Generate Query for Macro ---
-    query_macro = generate_query_macros()
+    query_macro = generate_query_macros(per_macro=per_macro, scope=scope, selection=selection)
     filename_macro = os.path.join(OUTPUT_DIR, "query_macro.ql")
     with open(filename_macro, 'w', encoding='utf-8') as f:
         f.write(query_macro)
@@ -751,18 +2119,31 @@ def main():
     print("-" * 60)
 
     # --- Generate Query REGEXP Calls+Args (family grouped, sha[-_]?N, camelCase) ---
-    q_calls_args = generate_query_regexp_calls_and_args()
+    q_calls_args = generate_query_regexp_calls_and_args(single_pass=single_pass, scope=scope, selection=selection)
     file_calls_args = os.path.join(OUTPUT_DIR, "query_regexp_calls_and_args.ql")
     with open(file_calls_args, "w", encoding="utf-8") as f:
         f.write(q_calls_args)
     print(f"Generated: {file_calls_args}")
 
     # --- Generate Query REGEXP Macro (family grouped, sha[-_]?N) ---
-    q_macro_regexp = generate_query_regexp_macro()
+    q_macro_regexp = generate_query_regexp_macro(per_macro=per_macro, scope=scope, selection=selection)
     file_macro_regexp = os.path.join(OUTPUT_DIR, "query_regexp_macro.ql")
     with open(file_macro_regexp, "w", encoding="utf-8") as f:
         f.write(q_macro_regexp)
     print(f"Generated: {file_macro_regexp}")
 
+    # --- Generate Query on the quantum crypto model (--quantum) ---
+    if quantum:
+        file_quantum = os.path.join(OUTPUT_DIR, QUANTUM_QUERY)
+        with open(file_quantum, "w", encoding="utf-8") as f:
+            f.write(generate_query_quantum(scope=scope, selection=selection))
+        print(f"Generated: {file_quantum}")
+
+    # --- Shards of the two REGEXP queries (--shards=0 removes them) ---
+    if shards is None:
+        return
+    for filename, (path, reused) in write_regexp_shards(OUTPUT_DIR, shards, shard_by, single_pass=single_pass, per_macro=per_macro, scope=scope, selection=selection).items():
+        print(f"{'Up to date' if reused else 'Generated'}: {path or filename}")
+
 if __name__ == "__main__":
     main()
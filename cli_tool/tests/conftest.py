@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of cli_tool import each other as top-level packages, as core.py runs them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,13 @@
+from environ_detector.environ_detector import parse_makefile
+
+
+def test_pkg_config_modules_stop_at_the_end_of_the_line(tmp_path):
+    makefile = tmp_path / "Makefile"
+    makefile.write_text(
+        "app: app.o\n"
+        "\t$(CC) -o app app.o `pkg-config --libs --static libsodium` && pkg-config --libs openssl\n"
+        "install: app\n"
+        "\tcp app $(PREFIX)/bin\n"
+    )
+    libs, _flags, _env_vars = parse_makefile(str(makefile))
+    assert libs == {"libsodium", "openssl"}
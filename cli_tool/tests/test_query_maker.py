@@ -0,0 +1,38 @@
+import re
+import time
+
+from query_maker import query_maker
+
+
+def glued_tokens():
+    return sorted(t for t in query_maker.concatenation_table() if re.fullmatch(r"[a-z0-9]+", t))
+
+
+def test_glued_pattern_is_linear_on_repeated_tokens():
+    # sha256 is both a token and sha + 256: an ambiguous pattern backtracks exponentially here
+    pattern = re.compile(query_maker.glued_pattern(glued_tokens()))
+    start = time.perf_counter()
+    assert pattern.fullmatch("sha256" * 14 + "q") is None
+    assert pattern.fullmatch("des3" * 200 + "q") is None
+    assert time.perf_counter() - start < 0.5
+
+
+def test_glued_pattern_matches_split_glued():
+    table = query_maker.concatenation_table()
+    pattern = re.compile(query_maker.glued_pattern(glued_tokens()))
+    for segment in ["aes256gcm", "curve25519xsalsa20poly1305", "aesgcm", "3des", "sha256", "sha256q", "gcm128"]:
+        split = query_maker.split_glued(segment, table) or []
+        assert bool(pattern.fullmatch(segment)) == (len(split) >= 2), segment
+
+
+def test_glued_concatenations():
+    names = {
+        "crypto_box_curve25519xsalsa20poly1305": True,
+        "EVP_aes256gcm_init": True,
+        # Tokens glued without digits between them are not a concatenation, as before
+        "aesgcm": False,
+        "sha256": False,
+    }
+    for name, concatenated in names.items():
+        assert (query_maker.describe_concatenated(name) is not None) == concatenated, name
+    assert query_maker.describe_concatenated("sha256" * 20) is None
@@ -10,7 +10,6 @@ import subprocess
 import queue
 import sys
 import inspect
-import sqlite3
 import traceback
 import shutil
 import csv
@@ -31,9 +30,10 @@ if cli_tool_path not in sys.path:
 # CLI TOOLS IMPORT - Analysis backend functions
 # ============================================================================
 try:
-    from cli_tool.query_maker.query_maker import generate_query_no_args, generate_query_with_args, generate_query_macros, generate_query_regexp_calls_and_args, generate_query_regexp_macro
-    from cli_tool.environ_detector.environ_detector import scan_project as cli_scan_environment
-    from cli_tool.db_creator_updater.db_creator_updater import update as cli_update_db
+    from cli_tool.query_maker.query_maker import generate_query_no_args, generate_query_with_args, generate_query_macros, generate_query_regexp_calls_and_args, generate_query_regexp_macro, generate_all_queries, suite_queries, write_query_suite, analyze_command, analysis_bqrs_path, ANALYSIS_SUITE, SCAN_SUITE, make_selection, reload_taxonomy_if_changed, json_path as TAXONOMY_PATH, QUANTUM_QUERY, split_concatenated_results, primitive_repository, SEARCH_LIMIT
+    from cli_tool.environ_detector.environ_detector import scan_project as cli_scan_environment, match_libraries
+    from cli_tool.db_creator_updater.db_migrations import migrate as cli_migrate_db
+    from cli_tool.db_creator_updater.db_updates import apply_updates as cli_apply_updates, BUNDLE_DIR
     from cli_tool.report_maker.report_maker import make_pdf_report as cli_make_pdf_report
     cli_dependencies_found = True
 except ImportError as e:
@@ -45,12 +45,29 @@ except ImportError as e:
                          "Analysis actions will be disabled.")
     cli_dependencies_found = False
     def cli_scan_environment(path): raise NotImplementedError("environ_detector not found")
-    def cli_update_db(): raise NotImplementedError("db_creator_updater not found")
+    def match_libraries(detected, libraries): raise NotImplementedError("environ_detector not found")
+    def cli_migrate_db(db_path): return None
+    def cli_apply_updates(source, db_path): raise NotImplementedError("db_creator_updater not found")
+    BUNDLE_DIR = None
     def generate_query_no_args(cat, prim): raise NotImplementedError("query_maker not found")
     def generate_query_with_args(cat, prim): raise NotImplementedError("query_maker not found")
     def generate_query_macros(): raise NotImplementedError("query_maker not found")
     def generate_query_regexp_calls_and_args(): raise NotImplementedError("query_maker not found")
     def generate_query_regexp_macro(): raise NotImplementedError("query_maker not found")
+    def generate_all_queries(db_path, library_ids, output_dir, data_extensions=False, selection=None, quantum=False): raise NotImplementedError("query_maker not found")
+    def suite_queries(output_dir, query_files): return []
+    def write_query_suite(output_dir, suite_name, query_files, description=None): raise NotImplementedError("query_maker not found")
+    def analyze_command(database_path, suite_path, sarif_path): raise NotImplementedError("query_maker not found")
+    def analysis_bqrs_path(database_path, query_file): raise NotImplementedError("query_maker not found")
+    ANALYSIS_SUITE = "crypto_analysis.qls"
+    SCAN_SUITE = "crypto_scan.qls"
+    def make_selection(include=None, exclude=None): raise NotImplementedError("query_maker not found")
+    def reload_taxonomy_if_changed(): return False
+    TAXONOMY_PATH = None
+    QUANTUM_QUERY = "query_quantum.ql"
+    def split_concatenated_results(sarif_path, selection=None): return 0
+    def primitive_repository(db_path, snapshot=False): raise NotImplementedError("query_maker not found")
+    SEARCH_LIMIT = 500
     def cli_make_pdf_report(bqrs_path, output_pdf): raise NotImplementedError("report_maker not found")
 
 # ============================================================================
@@ -67,15 +84,22 @@ os.makedirs(GENERATED_QL_OUTPUT_DIR, exist_ok=True)
 PROJECT_ROOT_DIR = _gui_script_dir
 PROJECT_OUTPUTS_DIR = os.path.join(PROJECT_ROOT_DIR, 'outputs')
 os.makedirs(PROJECT_OUTPUTS_DIR, exist_ok=True)
+PREGENERATED_LIBRARY_IDS = [1, 2, 3, 4, 5, 6, 7]  # Library IDs the queries are generated for
+# Queries of the project scan and the prefix of their results in PROJECT_OUTPUTS_DIR
+SCAN_QUERY_OUTPUTS = {
+    "query_noargs.ql": "problem_primitives-noargs",
+    "query_withargs.ql": "problem_primitives-withargs",
+    "query_macro.ql": "problem_primitives-macro",
+    "query_regexp_calls_and_args.ql": "problem_primitives-regexp-calls-and-args",
+    "query_regexp_macro.ql": "problem_primitives-regexp-macro",
+}
 
 # ============================================================================
 # DATABASE HELPER FUNCTIONS
 # ============================================================================
-def get_all_libraries(conn):
-    """Retrieve all library IDs and names from the database"""
-    cursor = conn.cursor()
-    cursor.execute("SELECT library_id, name FROM Libraries ORDER BY library_id")
-    return cursor.fetchall()
+def get_all_libraries():
+    """Retrieve all library IDs and names from the database, through the connection shared with the generators"""
+    return primitive_repository(CORE_DB_PATH).libraries()
 
 # ============================================================================
 # GUI ICONS - Base64 encoded images for file tree
@@ -99,6 +123,8 @@ folder_icon_tk = None  # Folder icon for tree view
 file_icon_tk = None    # File icon for tree view
 sarif_load_functions = {}  # Dictionary to store SARIF load functions for auto-refresh
 last_analysis_output_dir = None  # Last directory where analysis results were saved
+generated_family_selection = None  # Family selection the generated queries were built with (None = all)
+generated_library_ids = None  # Library IDs the generated queries were built for
 sarif_tabs_dict = {}  # Dictionary to store SARIF tab information (tab_name -> (sarif_file, text_widget))
 
 # ============================================================================
@@ -434,8 +460,114 @@ def action_create_codeql_database(tree, status_label_widget=None):
 # ============================================================================
 # CODEQL ANALYSIS - Analyze database with pre-generated queries
 # ============================================================================
-def action_analyze_codeql_database(tree, status_label_widget=None, tab_creator_callback=None, explorer_window=None):
-    """Analyze a CodeQL database using pre-generated queries"""
+def run_query_suite(database_path, query_files, suite_name, sarif_path):
+    """
+    Writes the suite of query_files (their shards for the sharded ones) to the generated pack
+    and runs it with a single `codeql database analyze`, which evaluates every query in one
+    evaluator on every core and writes their interpreted results to sarif_path.
+    Returns the queries of the suite, or None when the suite could not be run.
+    """
+    queries = suite_queries(GENERATED_QL_OUTPUT_DIR, query_files)
+    if not queries:
+        print(f"WARNING: None of {', '.join(query_files)} found in {GENERATED_QL_OUTPUT_DIR}")
+        return None
+    suite_path = write_query_suite(GENERATED_QL_OUTPUT_DIR, suite_name, queries)
+    print(f"Suite {suite_name}: {', '.join(queries)}")
+    cmd_analyze = analyze_command(database_path, suite_path, sarif_path)
+    print(f"Command: {' '.join(cmd_analyze)}")
+    result = subprocess.run(
+        cmd_analyze,
+        capture_output=True,
+        text=True,
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    )
+    if result.stdout:
+        print(f"STDOUT:\n{result.stdout}")
+    if result.stderr:
+        print(f"STDERR:\n{result.stderr}")
+    if result.returncode != 0:
+        print(f"FAILED: Could not run the suite {suite_name}. Exit code: {result.returncode}")
+        return None
+    print(f"SUCCESS: SARIF generated: {sarif_path}")
+    return queries
+
+regeneration_lock = threading.Lock()  # Serializes the generations started by the actions and the input watcher
+
+def regenerate_queries(selection=None, library_ids=None):
+    """Generate all queries for the given family selection and libraries, reusing the files whose inputs did not change"""
+    global generated_family_selection, generated_library_ids
+    library_ids = library_ids or PREGENERATED_LIBRARY_IDS
+    with regeneration_lock:
+        reload_taxonomy_if_changed()
+        cli_migrate_db(CORE_DB_PATH)
+        # The primitive rows go to one data extension file per library: a DB edit rebuilds only
+        # the files of the libraries it touches, and the query texts (and their compilation) stay
+        results = generate_all_queries(CORE_DB_PATH, library_ids, GENERATED_QL_OUTPUT_DIR, data_extensions=True, selection=selection, quantum=True)
+        generated_family_selection = selection
+        generated_library_ids = library_ids
+    for filename, (path, reused) in results.items():
+        if path is None:
+            print(f"No query generated for {filename}")
+        elif reused:
+            print(f"Up to date: {filename}")
+        else:
+            print(f"Generated {filename}")
+    return results
+
+# ============================================================================
+# HOT RELOAD - Regenerate the queries when cats_alts.json or the DB change
+# ============================================================================
+QUERY_INPUTS_POLL_MS = 2000  # Polling interval of the query inputs
+
+def query_inputs_mtime():
+    """Modification times of the files the generated queries are built from"""
+    # In WAL mode the DB writes land in the -wal file until the next checkpoint
+    return tuple(os.path.getmtime(p) if p and os.path.exists(p) else None for p in (TAXONOMY_PATH, CORE_DB_PATH, CORE_DB_PATH + "-wal"))
+
+def watch_query_inputs(window, last_seen=None):
+    """Poll cats_alts.json and the primitives DB, and regenerate the affected queries when they change"""
+    if not window.winfo_exists():
+        return
+    current = query_inputs_mtime()
+    if last_seen is not None and current != last_seen and generated_library_ids is not None:
+        log_queue.put("Taxonomy or primitives DB changed, regenerating the affected queries...")
+        def task():
+            results = regenerate_queries(generated_family_selection, generated_library_ids)
+            rebuilt = [filename for filename, (path, reused) in results.items() if path and not reused]
+            log_queue.put(f"Regenerated: {', '.join(rebuilt)}" if rebuilt else "Generated queries already up to date")
+        run_in_thread(task)
+    window.after(QUERY_INPUTS_POLL_MS, lambda: watch_query_inputs(window, current))
+
+def action_analyze_codeql_database_families(tree, status_label_widget=None, tab_creator_callback=None, explorer_window=None):
+    """Ask for the algorithm families to include/exclude, then analyze with queries restricted to them"""
+    current = generated_family_selection or {"include": [], "exclude": []}
+    include = ask_string_with_paste(
+        "Algorithm Families",
+        "Categories or subcategories to include, comma separated (empty for all):",
+        parent=tree.winfo_toplevel(),
+        initial_value=", ".join(current["include"])
+    )
+    if include is None:
+        return
+    exclude = ask_string_with_paste(
+        "Algorithm Families",
+        "Categories or subcategories to exclude, comma separated (empty for none):",
+        parent=tree.winfo_toplevel(),
+        initial_value=", ".join(current["exclude"])
+    )
+    if exclude is None:
+        return
+    include = [n.strip() for n in include.split(",") if n.strip()]
+    exclude = [n.strip() for n in exclude.split(",") if n.strip()]
+    selection = make_selection(include, exclude) if include or exclude else None
+    action_analyze_codeql_database(tree, status_label_widget, tab_creator_callback, explorer_window, selection=selection)
+
+def action_analyze_codeql_database(tree, status_label_widget=None, tab_creator_callback=None, explorer_window=None, selection=None, engine="names"):
+    """
+    Analyze a CodeQL database using pre-generated queries, regenerated first if selection differs.
+    engine="names" runs the regexp queries on the names of all calls and macros, engine="quantum"
+    the query classifying the algorithms modeled by the CodeQL quantum crypto library.
+    """
     selected_item_id = tree.focus()
     if not selected_item_id:
         messagebox.showwarning("No Selection", "Please select a CodeQL database folder to analyze.")
@@ -454,15 +586,22 @@ def action_analyze_codeql_database(tree, status_label_widget=None, tab_creator_c
 
     log_queue.put(f"Starting CodeQL analysis on database: {selected_path}")
 
-    # Define only the two regexp query files to run
-    query_files = [
-        "query_regexp_calls_and_args.ql",
-        "query_regexp_macro.ql"
-    ]
+    # Define only the two regexp query files to run, or the quantum model one
+    if engine == "quantum":
+        query_files = [QUANTUM_QUERY]
+    else:
+        query_files = [
+            "query_regexp_calls_and_args.ql",
+            "query_regexp_macro.ql"
+        ]
 
     def analysis_task():
         global last_analysis_output_dir
         try:
+            if selection != generated_family_selection:
+                print(f"Regenerating queries for the family selection: {selection}")
+                regenerate_queries(selection, generated_library_ids)
+
             if status_label_widget:
                 status_label_widget.config(text=f"Status: Analyzing database...")
 
@@ -471,142 +610,27 @@ def action_analyze_codeql_database(tree, status_label_widget=None, tab_creator_c
             last_analysis_output_dir = output_dir  # Store for SARIF loading
             log_queue.put(f"Output directory: {output_dir}")
 
-            successful_queries = 0
-            failed_queries = 0
-            sarif_files_to_merge = []
-
-            for query_file in query_files:
-                query_path = os.path.join(GENERATED_QL_OUTPUT_DIR, query_file)
-
-                if not os.path.exists(query_path):
-                    log_queue.put(f"WARNING: Skipping {query_file} - file not found")
-                    continue
-
-                # Define output paths
-                query_basename = os.path.splitext(query_file)[0]
-                bqrs_path = os.path.join(output_dir, f"{query_basename}.bqrs")
-                sarif_path = os.path.join(output_dir, f"{query_basename}.sarif")
-
-                print(f"\n{'='*60}")
-                print(f"Running query: {query_file}")
-                print(f"{'='*60}")
-
-                # Step 1: Run CodeQL query
-                cmd_run = [
-                    "codeql", "query", "run",
-                    f"--database={selected_path}",
-                    query_path,
-                    f"--output={bqrs_path}"
-                ]
-
-                print(f"Command: {' '.join(cmd_run)}")
-
-                try:
-                    result = subprocess.run(
-                        cmd_run,
-                        capture_output=True,
-                        text=True,
-                        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                    )
-
-                    if result.stdout:
-                        print(f"STDOUT:\n{result.stdout}")
-                    if result.stderr:
-                        print(f"STDERR:\n{result.stderr}")
-
-                    if result.returncode != 0:
-                        print(f"FAILED: Could not run query {query_file}. Exit code: {result.returncode}")
-                        failed_queries += 1
-                        continue
-
-                    print(f"SUCCESS: Query executed successfully: {bqrs_path}")
-
-                    # Step 2: Convert BQRS to SARIF
-                    print(f"Converting BQRS to SARIF...")
-                    cmd_interpret = [
-                        "codeql", "bqrs", "interpret",
-                        "--format=sarifv2.1.0",
-                        "-t=kind=problem",
-                        f"--output={sarif_path}",
-                        "--",
-                        bqrs_path
-                    ]
-
-                    print(f"Command: {' '.join(cmd_interpret)}")
-
-                    result_interpret = subprocess.run(
-                        cmd_interpret,
-                        capture_output=True,
-                        text=True,
-                        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                    )
-
-                    if result_interpret.stdout:
-                        print(f"STDOUT:\n{result_interpret.stdout}")
-                    if result_interpret.stderr:
-                        print(f"STDERR:\n{result_interpret.stderr}")
-
-                    if result_interpret.returncode == 0:
-                        print(f"SUCCESS: SARIF generated: {sarif_path}")
-                        successful_queries += 1
-                        # Add to merge list if SARIF exists
-                        if os.path.exists(sarif_path):
-                            sarif_files_to_merge.append(sarif_path)
-                    else:
-                        print(f"WARNING: SARIF conversion failed for {query_file}")
-                        successful_queries += 1  # Still count as success since query ran
-
-                except FileNotFoundError:
-                    print(f"ERROR: 'codeql' command not found. Please ensure CodeQL CLI is in your PATH.")
-                    failed_queries += 1
-                    break
-                except Exception as e:
-                    print(f"ERROR: Error processing {query_file}: {e}")
-                    print(traceback.format_exc())
-                    failed_queries += 1
-
-            # Merge SARIF files into res.sarif
+            # All the queries (or their shards) in one suite, analyzed straight into res.sarif
             res_sarif_path = os.path.join(output_dir, "res.sarif")
-            if sarif_files_to_merge:
-                try:
-                    print(f"\n{'='*60}")
-                    print(f"Merging SARIF files into res.sarif...")
-                    print(f"{'='*60}")
-
-                    # Build the merge command
-                    cmd_merge = ["codeql", "github", "merge-results"]
-                    for sarif_file in sarif_files_to_merge:
-                        cmd_merge.append(f"--sarif={sarif_file}")
-                    cmd_merge.append(f"--output={res_sarif_path}")
-
-                    print(f"Command: {' '.join(cmd_merge)}")
-
-                    result_merge = subprocess.run(
-                        cmd_merge,
-                        capture_output=True,
-                        text=True,
-                        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                    )
-
-                    if result_merge.stdout:
-                        print(f"STDOUT:\n{result_merge.stdout}")
-                    if result_merge.stderr:
-                        print(f"STDERR:\n{result_merge.stderr}")
-
-                    if result_merge.returncode == 0:
-                        print(f"SUCCESS: Merged SARIF saved to: {res_sarif_path}")
-                    else:
-                        print(f"ERROR: Failed to merge SARIF files. Exit code: {result_merge.returncode}")
-
-                except Exception as e:
-                    print(f"ERROR: Failed to merge SARIF files: {e}")
-                    print(traceback.format_exc())
+            print(f"\n{'='*60}")
+            print(f"Running queries: {', '.join(query_files)}")
+            print(f"{'='*60}")
+            try:
+                queries = run_query_suite(selected_path, query_files, ANALYSIS_SUITE, res_sarif_path)
+            except FileNotFoundError:
+                print(f"ERROR: 'codeql' command not found. Please ensure CodeQL CLI is in your PATH.")
+                queries = None
+            if queries:
+                # Split the "Concatenated" names into their algorithms and alternatives
+                rewritten = split_concatenated_results(res_sarif_path, selection)
+                if rewritten:
+                    print(f"Split {rewritten} concatenated result(s) into their algorithms")
 
             # Summary
             print(f"\n{'='*60}")
             print(f"Analysis Complete!")
             print(f"{'='*60}")
-            print(f"Successful queries: {successful_queries}/{len(query_files)}")
+            print(f"Queries run: {len(queries) if queries else 0} ({', '.join(query_files)})")
             print(f"Results saved to: {output_dir}")
 
             # Create or update tab for this database
@@ -709,6 +733,70 @@ def show_search_dialog(text_widget):
     # Bind Escape to close
     search_window.bind("<Escape>", lambda e: search_window.destroy())
 
+# ============================================================================
+# PRIMITIVE SEARCH - Browse crypto_primitives.db through its full-text index
+# ============================================================================
+PRIMITIVE_SEARCH_DELAY_MS = 150  # Typing pause before the search runs
+
+def create_primitive_search_tab(notebook):
+    """Add the 'Primitives' tab: substring or prefix search over names, libraries, categories and alternatives"""
+    tab_frame = ttk.Frame(notebook)
+    notebook.add(tab_frame, text="Primitives")
+
+    # Search bar
+    bar = ttk.Frame(tab_frame, padding=5)
+    bar.pack(side=tk.TOP, fill=tk.X)
+    ttk.Label(bar, text="Search:").pack(side=tk.LEFT)
+    search_entry = ttk.Entry(bar, width=40)
+    search_entry.pack(side=tk.LEFT, padx=5)
+    prefix_var = tk.BooleanVar(master=tab_frame, value=False)
+    ttk.Checkbutton(bar, text="Name prefix", variable=prefix_var, command=lambda: schedule_search()).pack(side=tk.LEFT, padx=5)
+    status_label = ttk.Label(bar, text="")
+    status_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+    # Results
+    columns = ("library", "categories", "alternative", "need_arg")
+    results_frame = ttk.Frame(tab_frame)
+    results_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+    results_scrollbar = ttk.Scrollbar(results_frame, orient=tk.VERTICAL)
+    results_tree = ttk.Treeview(results_frame, columns=columns, yscrollcommand=results_scrollbar.set)
+    results_scrollbar.config(command=results_tree.yview)
+    results_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    results_tree.heading("#0", text="Primitive", anchor='w')
+    results_tree.column("#0", width=250, anchor='w')
+    for col, title, width in zip(columns, ("Library", "Categories", "Alternative", "Argument"), (100, 200, 200, 70)):
+        results_tree.heading(col, text=title, anchor='w')
+        results_tree.column(col, width=width, anchor='w')
+
+    pending = {"after_id": None}
+
+    def do_search():
+        pending["after_id"] = None
+        results_tree.delete(*results_tree.get_children())
+        text = search_entry.get().strip()
+        if not text:
+            status_label.config(text="")
+            return
+        try:
+            rows = primitive_repository(CORE_DB_PATH).search(text, prefix=prefix_var.get())
+        except Exception as e:
+            status_label.config(text=f"Search failed: {e}")
+            return
+        for name, library, categories, alternative, need_arg in rows:
+            results_tree.insert('', tk.END, text=name, values=(library or "", categories or "", alternative or "", "" if need_arg is None else need_arg))
+        status_label.config(text=f"{len(rows)} primitive(s)" + (" (first results only)" if len(rows) == SEARCH_LIMIT else ""))
+
+    def schedule_search(event=None):
+        # Search once the user stops typing
+        if pending["after_id"] is not None:
+            tab_frame.after_cancel(pending["after_id"])
+        pending["after_id"] = tab_frame.after(PRIMITIVE_SEARCH_DELAY_MS, do_search)
+
+    search_entry.bind("<KeyRelease>", schedule_search)
+    search_entry.bind("<Return>", lambda e: do_search())
+    return tab_frame
+
 # ============================================================================
 # SARIF PARSING HELPER - Parse SARIF files into human-readable format
 # ============================================================================
@@ -864,6 +952,8 @@ def show_context_menu(event, tree, log_text_widget=None, status_label=None, tab_
     context_menu = tk.Menu(tree, tearoff=0)
     context_menu.add_command(label="Create CodeQL Database", command=lambda: action_create_codeql_database(tree, status_label))
     context_menu.add_command(label="Analyze CodeQL Database", command=lambda: action_analyze_codeql_database(tree, status_label, tab_creator_callback, explorer_window))
+    context_menu.add_command(label="Analyze CodeQL Database (Algorithm Families)...", command=lambda: action_analyze_codeql_database_families(tree, status_label, tab_creator_callback, explorer_window))
+    context_menu.add_command(label="Analyze CodeQL Database (Quantum Model)", command=lambda: action_analyze_codeql_database(tree, status_label, tab_creator_callback, explorer_window, selection=generated_family_selection, engine="quantum"))
     context_menu.add_command(label="View SARIF result", command=lambda: action_view_csv_result(tree, tab_creator_callback, explorer_window))
 
     context_menu.add_separator()
@@ -899,15 +989,24 @@ def action_scan_environment():
 
 def action_update_db():
     if not cli_dependencies_found: log_queue.put("Action 'Update DB' disabled: CLI dependencies not found."); return
-    log_queue.put("Creating or updating the database...")
+    log_queue.put(f"Applying the delta bundles of {BUNDLE_DIR}...")
     def task():
         try:
-            cli_update_db()
-            log_queue.put("Database updated successfully.")
+            applied = cli_apply_updates(BUNDLE_DIR, CORE_DB_PATH)
+            log_queue.put(f"Database updated to data version {applied[-1]}." if applied else "Database already up to date.")
         except Exception as e:
             log_queue.put(f"Error updating database: {e}")
     run_in_thread(task)
 
+def auto_library_ids(project_path):
+    """IDs of the Libraries rows linked by the project, as detected by environ_detector"""
+    detected = cli_scan_environment(project_path)['libraries']
+    libraries = get_all_libraries()
+    library_ids = match_libraries(detected, libraries)
+    names = [name for lib_id, name in libraries if lib_id in library_ids]
+    log_queue.put(f"Linked libraries found: {', '.join(names) if names else 'none'} (detected: {', '.join(detected) or 'none'})")
+    return library_ids
+
 def action_scan_project_codeql(root_window):
     global current_opened_folder_path
     if not cli_dependencies_found:
@@ -928,129 +1027,51 @@ def action_scan_project_codeql(root_window):
     if not codeql_db_path:
         log_queue.put("CodeQL database path not provided. Scan cancelled."); return
 
-    log_queue.put(f"Starting CodeQL scan for library IDs 1-7 (Project: {project_context_path}) using DB: {codeql_db_path}")
+    log_queue.put(f"Starting CodeQL scan (Project: {project_context_path}) using DB: {codeql_db_path}")
     def task():
         try:
-            # Use pre-generated query files (all 5 queries)
-            filename1 = os.path.join(GENERATED_QL_OUTPUT_DIR, "query_noargs.ql")
-            filename2 = os.path.join(GENERATED_QL_OUTPUT_DIR, "query_withargs.ql")
-            filename3 = os.path.join(GENERATED_QL_OUTPUT_DIR, "query_macro.ql")
-            filename4 = os.path.join(GENERATED_QL_OUTPUT_DIR, "query_regexp_calls_and_args.ql")
-            filename5 = os.path.join(GENERATED_QL_OUTPUT_DIR, "query_regexp_macro.ql")
-
-            # Verify that the pre-generated queries exist
-            if not os.path.exists(filename1):
-                log_queue.put(f"Error: Pre-generated query file not found: {filename1}"); return
-            if not os.path.exists(filename2):
-                log_queue.put(f"Error: Pre-generated query file not found: {filename2}"); return
-            if not os.path.exists(filename3):
-                log_queue.put(f"Error: Pre-generated query file not found: {filename3}"); return
-            if not os.path.exists(filename4):
-                log_queue.put(f"Error: Pre-generated query file not found: {filename4}"); return
-            if not os.path.exists(filename5):
-                log_queue.put(f"Error: Pre-generated query file not found: {filename5}"); return
+            # Generate the no-args and with-args queries only for the libraries the project links
+            library_ids = auto_library_ids(project_context_path) or PREGENERATED_LIBRARY_IDS
+            log_queue.put(f"Library IDs: {', '.join(map(str, library_ids))}")
+            if library_ids != generated_library_ids:
+                regenerate_queries(generated_family_selection, library_ids)
+
+            # Use pre-generated query files (all 5 queries), run as one suite
+            query_files = list(SCAN_QUERY_OUTPUTS)
+            suite = {q: suite_queries(GENERATED_QL_OUTPUT_DIR, [q]) for q in query_files}
+            missing = [q for q, names in suite.items() if not names]
+            if missing:
+                log_queue.put(f"Error: Pre-generated query file not found: {', '.join(os.path.join(GENERATED_QL_OUTPUT_DIR, q) for q in missing)}"); return
 
             log_queue.put("Using pre-generated query files:")
-            log_queue.put(f"  - {os.path.basename(filename1)}")
-            log_queue.put(f"  - {os.path.basename(filename2)}")
-            log_queue.put(f"  - {os.path.basename(filename3)}")
-            log_queue.put(f"  - {os.path.basename(filename4)}")
-            log_queue.put(f"  - {os.path.basename(filename5)}")
-
-
+            for query_file in query_files:
+                log_queue.put(f"  - {query_file}")
 
             os.makedirs(PROJECT_OUTPUTS_DIR, exist_ok=True)
-            bqrs_output_file_noargs = os.path.join(PROJECT_OUTPUTS_DIR, 'problem_primitives-noargs-analysis.bqrs')
-            bqrs_output_file_withargs = os.path.join(PROJECT_OUTPUTS_DIR, 'problem_primitives-withargs-analysis.bqrs')
-            brqs_output_file_macro = os.path.join(PROJECT_OUTPUTS_DIR, 'problem_primitives-macro-analysis.bqrs')
-            brqs_output_file_regexp_calls_and_args = os.path.join(PROJECT_OUTPUTS_DIR, 'problem_primitives-regexp-calls-and-args-analysis.bqrs')
-            brqs_output_file_regexp_macro = os.path.join(PROJECT_OUTPUTS_DIR, 'problem_primitives-regexp-macro-analysis.bqrs')
-            log_queue.put(f"Running CodeQL queries, output to:")
-            log_queue.put(f"  - {bqrs_output_file_noargs}")
-            log_queue.put(f"  - {bqrs_output_file_withargs}")
-            log_queue.put(f"  - {brqs_output_file_macro}")
-            log_queue.put(f"  - {brqs_output_file_regexp_calls_and_args}")
-            log_queue.put(f"  - {brqs_output_file_regexp_macro}")
-
-            # NO ARGS CODEQL COMMAND
-            cmd = [
-                "codeql", "query", "run",
-                f"--database={codeql_db_path}",
-                filename1,
-                f"--output={bqrs_output_file_noargs}",
-            ]
-            log_queue.put(f"Executing: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            if result.stdout: log_queue.put(f"CodeQL STDOUT:\n{result.stdout}")
-            if result.stderr: log_queue.put(f"CodeQL STDERR:\n{result.stderr}")
-            if result.returncode == 0:
-                log_queue.put(f"Successfully ran query: {os.path.basename(filename1)}")
-            else:
-                log_queue.put(f"Failed to run query: {os.path.basename(filename1)}. Exit code: {result.returncode}")
-
-            # WITH ARGS CODEQL COMMAND
-            cmd = [
-                "codeql", "query", "run",
-                f"--database={codeql_db_path}",
-                filename2,
-                f"--output={bqrs_output_file_withargs}",
-            ]
+            sarif_output_file = os.path.join(PROJECT_OUTPUTS_DIR, 'problem_primitives-scan-analysis.sarif')
+            suite_path = write_query_suite(GENERATED_QL_OUTPUT_DIR, SCAN_SUITE, [n for names in suite.values() for n in names])
+            cmd = analyze_command(codeql_db_path, suite_path, sarif_output_file)
             log_queue.put(f"Executing: {' '.join(cmd)}")
             result = subprocess.run(cmd, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
             if result.stdout: log_queue.put(f"CodeQL STDOUT:\n{result.stdout}")
             if result.stderr: log_queue.put(f"CodeQL STDERR:\n{result.stderr}")
-            if result.returncode == 0:
-                log_queue.put(f"Successfully ran query: {os.path.basename(filename2)}")
-            else:
-                log_queue.put(f"Failed to run query: {os.path.basename(filename2)}. Exit code: {result.returncode}")
-
-            # MACRO CODEQL COMMAND
-            cmd = [
-                "codeql", "query", "run",
-                f"--database={codeql_db_path}",
-                filename3,
-                f"--output={brqs_output_file_macro}",
-            ]
-            log_queue.put(f"Executing: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            if result.stdout: log_queue.put(f"CodeQL STDOUT:\n{result.stdout}")
-            if result.stderr: log_queue.put(f"CodeQL STDERR:\n{result.stderr}")
-            if result.returncode == 0:
-                log_queue.put(f"Successfully ran query: {os.path.basename(filename3)}")
-            else:
-                log_queue.put(f"Failed to run query: {os.path.basename(filename3)}. Exit code: {result.returncode}")
-
-            # REGEXP CALLS AND ARGS CODEQL COMMAND
-            cmd = [
-                "codeql", "query", "run",
-                f"--database={codeql_db_path}",
-                filename4,
-                f"--output={brqs_output_file_regexp_calls_and_args}",
-            ]
-            log_queue.put(f"Executing: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            if result.stdout: log_queue.put(f"CodeQL STDOUT:\n{result.stdout}")
-            if result.stderr: log_queue.put(f"CodeQL STDERR:\n{result.stderr}")
-            if result.returncode == 0:
-                log_queue.put(f"Successfully ran query: {os.path.basename(filename4)}")
-            else:
-                log_queue.put(f"Failed to run query: {os.path.basename(filename4)}. Exit code: {result.returncode}")
-
-            # REGEXP MACRO CODEQL COMMAND
-            cmd = [
-                "codeql", "query", "run",
-                f"--database={codeql_db_path}",
-                filename5,
-                f"--output={brqs_output_file_regexp_macro}",
-            ]
-            log_queue.put(f"Executing: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            if result.stdout: log_queue.put(f"CodeQL STDOUT:\n{result.stdout}")
-            if result.stderr: log_queue.put(f"CodeQL STDERR:\n{result.stderr}")
-            if result.returncode == 0:
-                log_queue.put(f"Successfully ran query: {os.path.basename(filename5)}")
-            else:
-                log_queue.put(f"Failed to run query: {os.path.basename(filename5)}. Exit code: {result.returncode}")
+            if result.returncode != 0:
+                log_queue.put(f"Failed to run suite: {SCAN_SUITE}. Exit code: {result.returncode}"); return
+            log_queue.put(f"Successfully ran suite: {SCAN_SUITE}, SARIF saved to: {sarif_output_file}")
+
+            # The per-query results stay in the database: copy them where the reports are made from
+            log_queue.put("Query results, for the reports:")
+            for query_file, names in suite.items():
+                for name in names:
+                    # query.shardN.ql -> <prefix>-shardN-analysis.bqrs
+                    shard = "" if name == query_file else "-" + name.rsplit(".", 2)[1]
+                    bqrs_path = analysis_bqrs_path(codeql_db_path, name)
+                    output_file = os.path.join(PROJECT_OUTPUTS_DIR, f"{SCAN_QUERY_OUTPUTS[query_file]}{shard}-analysis.bqrs")
+                    if os.path.exists(bqrs_path):
+                        shutil.copyfile(bqrs_path, output_file)
+                        log_queue.put(f"  - {output_file}")
+                    else:
+                        log_queue.put(f"No results found for {name} in {os.path.dirname(bqrs_path)}")
 
         except FileNotFoundError:
             log_queue.put("Error: 'codeql' command not found. Please ensure CodeQL CLI is in your PATH.")
@@ -1228,6 +1249,10 @@ def create_file_explorer_window(folder_path_to_explore, root_window_to_destroy):
     csv_notebook = ttk.Notebook(right_frame)
     csv_notebook.pack(fill=tk.BOTH, expand=True, padx=(0,5), pady=(0,5))
 
+    # Permanent tab searching the primitives of the DB
+    if cli_dependencies_found:
+        create_primitive_search_tab(csv_notebook)
+
     # Dictionary to store tabs: {db_name: (tab_frame, text_area, res_sarif_path)}
     dynamic_tabs = {}
 
@@ -1332,6 +1357,8 @@ def create_file_explorer_window(folder_path_to_explore, root_window_to_destroy):
     # Start the main event loop
     print("Starting main event loop...")
     explorer_root.protocol("WM_DELETE_WINDOW", lambda: on_explorer_close(explorer_root))
+    if cli_dependencies_found:
+        watch_query_inputs(explorer_root)
     explorer_root.mainloop()
     print("Main loop exited")
 
@@ -1350,48 +1377,10 @@ def main_initial_window():
     """Main entry point - Pre-generates queries and launches GUI"""
     if cli_dependencies_found:
         try:
-            # Define library IDs to use (1 to 7)
-            library_ids = [1, 2, 3, 4, 5, 6, 7]
-            print(f"Pre-generating queries for library IDs: {library_ids}")
-
-            # Generate all 5 queries (create separate connections for each)
-            conn1 = sqlite3.connect(CORE_DB_PATH)
-            query_noargs_cached = generate_query_no_args(conn1, library_ids)
-            conn1.close()
-
-            conn2 = sqlite3.connect(CORE_DB_PATH)
-            query_withargs_cached = generate_query_with_args(conn2, library_ids)
-            conn2.close()
-
-            query_macro_cached = generate_query_macros()
-            query_regexp_calls_cached = generate_query_regexp_calls_and_args()
-            query_regexp_macro_cached = generate_query_regexp_macro()
-
-            # Write them to files immediately
-            if query_noargs_cached:
-                with open(os.path.join(GENERATED_QL_OUTPUT_DIR, "query_noargs.ql"), 'w') as f:
-                    f.write(query_noargs_cached)
-                print("Generated query_noargs.ql")
-
-            if query_withargs_cached:
-                with open(os.path.join(GENERATED_QL_OUTPUT_DIR, "query_withargs.ql"), 'w') as f:
-                    f.write(query_withargs_cached)
-                print("Generated query_withargs.ql")
-
-            if query_macro_cached:
-                with open(os.path.join(GENERATED_QL_OUTPUT_DIR, "query_macro.ql"), 'w') as f:
-                    f.write(query_macro_cached)
-                print("Generated query_macro.ql")
-
-            if query_regexp_calls_cached:
-                with open(os.path.join(GENERATED_QL_OUTPUT_DIR, "query_regexp_calls_and_args.ql"), 'w') as f:
-                    f.write(query_regexp_calls_cached)
-                print("Generated query_regexp_calls_and_args.ql")
-
-            if query_regexp_macro_cached:
-                with open(os.path.join(GENERATED_QL_OUTPUT_DIR, "query_regexp_macro.ql"), 'w') as f:
-                    f.write(query_regexp_macro_cached)
-                print("Generated query_regexp_macro.ql")
+            print(f"Pre-generating queries for library IDs: {PREGENERATED_LIBRARY_IDS}")
+
+            # Generate all 5 queries, reusing the files whose inputs did not change
+            regenerate_queries()
 
         except Exception as e:
             print(f"Warning: Failed to generate queries: {e}")